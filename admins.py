@@ -0,0 +1,45 @@
+import os
+from typing import Set
+
+import asyncpg
+
+# Админы общие для всех реплик: хранятся в таблице admins, а этот набор —
+# её копия в памяти, которую обновляют load_admins и события кластера
+ADMIN_IDS: Set[int] = set()
+
+
+def _env_admin_ids() -> Set[int]:
+    return {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().isdigit()}
+
+
+async def load_admins(db_pool: asyncpg.Pool):
+    """Добавляет админов из ADMIN_IDS в базу и перечитывает список"""
+    async with db_pool.acquire() as conn:
+        await conn.execute(
+            "INSERT INTO admins (user_id) SELECT unnest($1::bigint[]) ON CONFLICT (user_id) DO NOTHING",
+            list(_env_admin_ids())
+        )
+        rows = await conn.fetch("SELECT user_id FROM admins")
+    ADMIN_IDS.clear()
+    ADMIN_IDS.update(row["user_id"] for row in rows)
+
+
+async def grant_admin(db_pool: asyncpg.Pool, user_id: int, granted_by: int) -> bool:
+    """Делает пользователя админом. False, если он уже админ"""
+    async with db_pool.acquire() as conn:
+        added = await conn.fetchval(
+            """
+            INSERT INTO admins (user_id, granted_by) VALUES ($1, $2)
+            ON CONFLICT (user_id) DO NOTHING
+            RETURNING user_id
+            """,
+            user_id, granted_by
+        )
+    ADMIN_IDS.add(user_id)
+    return added is not None
+
+
+def subscribe(cluster, db_pool: asyncpg.Pool):
+    """Админы, добавленные в других репликах, появляются и здесь"""
+    cluster.on("admins", lambda event: ADMIN_IDS.add(event["user_id"]))
+    cluster.on("resync", lambda event: load_admins(db_pool))
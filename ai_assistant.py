@@ -1,18 +1,36 @@
 import os
 import json
 import logging
-import aiohttp
+import time
+import asyncio
 import asyncpg
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputFile, Update
 from telegram.ext import (
     ConversationHandler, CallbackQueryHandler, MessageHandler, 
     filters, ContextTypes, CommandHandler
 )
 
+from admins import ADMIN_IDS
+from ai_batch import (
+    AI_BATCH_CONCURRENCY, AI_BATCH_MAX_FILE_BYTES, AI_BATCH_MAX_ITEMS, BATCH_FILE_EXTENSIONS, BatchFileError,
+    PermanentError, claim_batch, create_batch, list_batches, parse_batch_file, render_results, retry_failed,
+    run_batch, stalled_batches
+)
+from outbox import reply
+
 logger = logging.getLogger(__name__)
 
 # Состояния для AI помощника
 AI_MENU, AI_SCRIPT_REVIEW_INPUT, AI_NEW_SCRIPT_INPUT, AI_EDITING_INPUT, AI_DESCRIPTION_INPUT = range(5)
+AI_BATCH_MODE, AI_BATCH_FILE = range(5, 7)
+
+# Названия режимов для пакетной обработки и итогового файла
+MODE_TITLES = {
+    "script_review": "Проверить сценарий",
+    "new_script": "Новый сценарий",
+    "editing_assist": "Визуальные эффекты и монтаж",
+    "description_gen": "Генератор описания"
+}
 
 # Промты для каждого режима AI помощника
 PROMPTS = {
@@ -49,12 +67,29 @@ PROMPTS = {
 DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.ai/v1/chat/completions")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
 
+# Активная модель меняется редко, поэтому не читаем её из базы на каждый запрос
+MODEL_CACHE_TTL = 300
+_model_cache = {"name": None, "expires_at": 0.0}
+
+def expire_caches():
+    """Сбрасывает просроченные закэшированные значения"""
+    if _model_cache["expires_at"] <= time.monotonic():
+        _model_cache["name"] = None
+
+def reset_model_cache():
+    _model_cache["name"] = None
+
 async def get_current_model(db_pool: asyncpg.Pool) -> str:
     """Получает активную модель из базы данных"""
+    if _model_cache["name"] is not None and _model_cache["expires_at"] > time.monotonic():
+        return _model_cache["name"]
     async with db_pool.acquire() as conn:
-        return await conn.fetchval(
+        model = await conn.fetchval(
             "SELECT model_name FROM model_settings WHERE is_active = TRUE LIMIT 1"
         )
+    _model_cache["name"] = model
+    _model_cache["expires_at"] = time.monotonic() + MODEL_CACHE_TTL
+    return model
 
 async def set_active_model(db_pool: asyncpg.Pool, model_name: str) -> bool:
     """Устанавливает активную модель в базе данных"""
@@ -64,46 +99,65 @@ async def set_active_model(db_pool: asyncpg.Pool, model_name: str) -> bool:
                 "UPDATE model_settings SET is_active = (model_name = $1)",
                 model_name
             )
+            reset_model_cache()
             return True
         except Exception as e:
             logger.error(f"Ошибка смены модели: {str(e)}")
             return False
 
+def get_http_session(bot_data: dict):
+    """Общая HTTP-сессия для запросов к API, создаётся при первом обращении"""
+    session = bot_data.get("http_session")
+    if session is None or session.closed:
+        # aiohttp нужен только AI помощнику, поэтому импортируем его здесь
+        import aiohttp
+
+        session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        bot_data["http_session"] = session
+    return session
+
+async def close_http_session(bot_data: dict):
+    session = bot_data.pop("http_session", None)
+    if session is not None:
+        await session.close()
+
+async def request_deepseek(prompt: str, text: str, bot_data: dict) -> str:
+    """Запрос к DeepSeek API. Ошибки не перехватываются, чтобы пакетный режим мог их повторить"""
+    model = await get_current_model(bot_data["db_pool"])
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+        "Accept": "application/json"
+    }
+
+    payload = {
+        "messages": [{
+            "role": "user",
+            "content": f"{prompt}\n\n{text}"
+        }],
+        "model": model,
+        "temperature": 0.7,
+        "max_tokens": 2000
+    }
+
+    session = get_http_session(bot_data)
+    async with session.post(
+        DEEPSEEK_API_URL,
+        json=payload,
+        headers=headers
+    ) as response:
+        response.raise_for_status()
+        result = await response.json()
+
+    if "choices" in result and len(result["choices"]) > 0:
+        return result["choices"][0]["message"]["content"].strip()
+    raise ValueError("Не удалось получить ответ от API")
+
 async def call_deepseek_api(prompt: str, text: str, context: ContextTypes.DEFAULT_TYPE) -> str:
     """Улучшенная функция для запросов к DeepSeek API"""
     try:
-        db_pool = context.bot_data["db_pool"]
-        model = await get_current_model(db_pool)
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Accept": "application/json"
-        }
-        
-        payload = {
-            "messages": [{
-                "role": "user",
-                "content": f"{prompt}\n\n{text}"
-            }],
-            "model": model,
-            "temperature": 0.7,
-            "max_tokens": 2000
-        }
-
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-            async with session.post(
-                DEEPSEEK_API_URL,
-                json=payload,
-                headers=headers
-            ) as response:
-                response.raise_for_status()
-                result = await response.json()
-                
-                if "choices" in result and len(result["choices"]) > 0:
-                    return result["choices"][0]["message"]["content"].strip()
-                return "Не удалось получить ответ от API"
-
+        return await request_deepseek(prompt, text, context.bot_data)
     except Exception as e:
         logger.error(f"API Error: {str(e)}", exc_info=True)
         return f"Ошибка обработки запроса: {str(e)}"
@@ -114,13 +168,15 @@ def get_ai_menu_keyboard():
         [InlineKeyboardButton("Новый сценарий", callback_data='ai_new_script')],
         [InlineKeyboardButton("Визуальные эффекты и монтаж", callback_data='ai_editing')],
         [InlineKeyboardButton("Генератор описания", callback_data='ai_description')],
+        [InlineKeyboardButton("📦 Пакетная обработка", callback_data='ai_batch')],
         [InlineKeyboardButton("Выход", callback_data='ai_exit')]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 async def start_ai(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    await update.callback_query.message.reply_text(
+    await reply(
+        update, context,
         "Добро пожаловать в AI помощник! Выберите задачу:",
         reply_markup=get_ai_menu_keyboard()
     )
@@ -141,13 +197,24 @@ async def ai_menu_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if choice in handlers:
         key, state = handlers[choice]
         text = PROMPTS[key]["description"] + "\n\n" + PROMPTS[key]["prompt"]
-        await query.message.reply_text(text)
+        await reply(update, context, text)
         return state
+    elif choice == 'ai_batch':
+        keyboard = [
+            [InlineKeyboardButton(title, callback_data=f"ai_batch_mode_{key}")]
+            for key, title in MODE_TITLES.items()
+        ]
+        await reply(
+            update, context,
+            "Пакетная обработка: один режим для многих сценариев или тем сразу. Выберите режим:",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return AI_BATCH_MODE
     elif choice == 'ai_exit':
-        await query.message.reply_text("Выход из AI помощника. Возвращайтесь, когда понадобится помощь!")
+        await reply(update, context, "Выход из AI помощника. Возвращайтесь, когда понадобится помощь!")
         return ConversationHandler.END
     else:
-        await query.message.reply_text("Неверный выбор, попробуйте снова.")
+        await reply(update, context, "Неверный выбор, попробуйте снова.")
         return AI_MENU
 
 async def process_script_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -157,8 +224,8 @@ async def process_script_review(update: Update, context: ContextTypes.DEFAULT_TY
         script,
         context
     )
-    await update.message.reply_text(response_text)
-    await show_ai_menu(update)
+    await reply(update, context, response_text)
+    await show_ai_menu(update, context)
     return AI_MENU
 
 async def process_new_script(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -168,8 +235,8 @@ async def process_new_script(update: Update, context: ContextTypes.DEFAULT_TYPE)
         topic,
         context
     )
-    await update.message.reply_text(response_text)
-    await show_ai_menu(update)
+    await reply(update, context, response_text)
+    await show_ai_menu(update, context)
     return AI_MENU
 
 async def process_editing_assist(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -179,8 +246,8 @@ async def process_editing_assist(update: Update, context: ContextTypes.DEFAULT_T
         question,
         context
     )
-    await update.message.reply_text(response_text)
-    await show_ai_menu(update)
+    await reply(update, context, response_text)
+    await show_ai_menu(update, context)
     return AI_MENU
 
 async def process_description_gen(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -190,43 +257,200 @@ async def process_description_gen(update: Update, context: ContextTypes.DEFAULT_
         input_text,
         context
     )
-    await update.message.reply_text(response_text)
-    await show_ai_menu(update)
+    await reply(update, context, response_text)
+    await show_ai_menu(update, context)
     return AI_MENU
 
-async def show_ai_menu(update: Update):
-    await update.message.reply_text(
+async def show_ai_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply(
+        update, context,
         "Что вы хотите сделать дальше?",
         reply_markup=get_ai_menu_keyboard()
     )
 
+async def select_batch_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
+    mode = update.callback_query.data[len("ai_batch_mode_"):]
+    if mode not in MODE_TITLES:
+        await show_ai_menu(update, context)
+        return AI_MENU
+    context.user_data["ai_batch_mode"] = mode
+    await reply(
+        update, context,
+        f"Режим: {MODE_TITLES[mode]}. Отправьте файл (до {AI_BATCH_MAX_ITEMS} элементов):\n"
+        "• .txt — сценарии через строку «---» или пустую строку, темы — по одной на строку "
+        "(без разделителей весь файл — один сценарий);\n"
+        "• .csv — колонка «текст», «сценарий» или «тема», иначе первая колонка;\n"
+        "• .zip — каждый .txt файл архива отдельный сценарий.\n"
+        "Результат придёт одним файлом."
+    )
+    return AI_BATCH_FILE
+
+async def receive_batch_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    document = update.message.document
+    filename = document.file_name or ""
+    if not filename.lower().endswith(BATCH_FILE_EXTENSIONS):
+        await reply(update, context, "Поддерживаются файлы .txt, .csv и .zip.")
+        return AI_BATCH_FILE
+    if document.file_size and document.file_size > AI_BATCH_MAX_FILE_BYTES:
+        await reply(update, context, f"Файл больше {AI_BATCH_MAX_FILE_BYTES // (1024 * 1024)} МБ.")
+        return AI_BATCH_FILE
+
+    file = await document.get_file()
+    data = bytes(await file.download_as_bytearray())
+    mode = context.user_data.get("ai_batch_mode", "script_review")
+    try:
+        items = parse_batch_file(filename, data, mode)
+    except BatchFileError as e:
+        await reply(update, context, f"❌ {str(e)}")
+        return AI_BATCH_FILE
+
+    batch = await create_batch(
+        context.bot_data["db_pool"], update.effective_user.id, update.effective_chat.id,
+        mode, filename, items
+    )
+    start_batch(context.bot_data, batch)
+    return ConversationHandler.END
+
+async def batch_file_expected(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply(update, context, "Отправьте файл .txt, .csv или .zip документом.")
+    return AI_BATCH_FILE
+
+def _batch_call(prompt: str, bot_data: dict):
+    import aiohttp
+
+    async def call(text: str) -> str:
+        try:
+            return await request_deepseek(prompt, text, bot_data)
+        except aiohttp.ClientResponseError as e:
+            # Ошибку запроса повтор не исправит, а 429 и 5xx обычно проходят сами
+            if 400 <= e.status < 500 and e.status != 429:
+                raise PermanentError(f"API ответил {e.status}: {e.message}") from e
+            raise
+    return call
+
+async def _run_batch(bot_data: dict, batch):
+    outbox = bot_data["outbox"]
+    chat_id = batch["chat_id"]
+    title = MODE_TITLES.get(batch["mode"], batch["mode"])
+    try:
+        progress = await (await outbox.send_message(
+            chat_id, f"📦 Пакет #{batch['id']} ({title}, {batch['filename']}) в работе…", mergeable=False
+        ))
+    except Exception as e:
+        # Без сообщения о ходе работы пакет всё равно выполняется, итог придёт файлом
+        logger.warning(f"Не удалось отправить прогресс пакета #{batch['id']}: {str(e)}")
+        progress = None
+
+    async def on_progress(done: int, failed: int, total: int):
+        if progress is None:
+            return
+        text = f"📦 Пакет #{batch['id']} ({title}): готово {done} из {total}"
+        if failed:
+            text += f", ошибок {failed}"
+        await outbox.edit_message_text(chat_id, progress.message_id, text)
+
+    semaphore = bot_data.setdefault("ai_batch_semaphore", asyncio.Semaphore(AI_BATCH_CONCURRENCY))
+    call = _batch_call(PROMPTS[batch["mode"]]["prompt"], bot_data)
+    try:
+        done, failed, total = await run_batch(bot_data["db_pool"], batch["id"], call, semaphore, on_progress)
+    except Exception as e:
+        logger.error(f"Пакет #{batch['id']} прерван: {str(e)}", exc_info=True)
+        await outbox.send_message(
+            chat_id, f"❌ Пакет #{batch['id']} прерван, готовые ответы сохранены, остальные будут доделаны позже."
+        )
+        return
+
+    content = await render_results(bot_data["db_pool"], batch, title)
+    await outbox.send_document(chat_id, InputFile(content, filename=f"ai_batch_{batch['id']}.txt"))
+    text = f"✅ Пакет #{batch['id']} готов: {done} из {total}."
+    if failed:
+        text += f" Ошибок: {failed}, повторить только их: /ai_batch_retry {batch['id']}"
+    await outbox.send_message(chat_id, text)
+
+def start_batch(bot_data: dict, batch):
+    """Запускает уже закреплённый за репликой пакет в фоне"""
+    tasks = bot_data.setdefault("ai_batch_tasks", set())
+    task = asyncio.create_task(_run_batch(bot_data, batch))
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+async def resume_batches(context: ContextTypes.DEFAULT_TYPE):
+    """Подхватывает пакеты, прерванные перезапуском или падением реплики"""
+    for batch_id in await stalled_batches(context.bot_data["db_pool"]):
+        batch = await claim_batch(context.bot_data["db_pool"], batch_id)
+        if batch is not None:
+            logger.info(f"Продолжаем пакет #{batch_id}")
+            start_batch(context.bot_data, batch)
+
+async def cancel_batches(bot_data: dict):
+    """Останавливает пакеты этой реплики, незавершённые элементы доделает resume_batches"""
+    tasks = list(bot_data.get("ai_batch_tasks", ()))
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def ai_batches_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    batches = await list_batches(context.bot_data["db_pool"], update.effective_user.id)
+    if not batches:
+        await reply(update, context, "Пакетов пока нет. Пакетная обработка — в меню AI помощника.")
+        return
+    lines = ["Ваши пакеты:"]
+    for batch in batches:
+        status = "в работе" if batch["status"] == "running" else "готов"
+        line = (
+            f"#{batch['id']} {MODE_TITLES.get(batch['mode'], batch['mode'])}, {batch['filename']}: {status}, "
+            f"{batch['done']} из {batch['total']}"
+        )
+        if batch["failed"]:
+            line += f", ошибок {batch['failed']} (/ai_batch_retry {batch['id']})"
+        lines.append(line)
+    await reply(update, context, "\n".join(lines))
+
+async def ai_batch_retry_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args or not context.args[0].isdigit():
+        await reply(update, context, "Использование: /ai_batch_retry <номер пакета>")
+        return
+    batch_id = int(context.args[0])
+    user_id = update.effective_user.id
+    db_pool = context.bot_data["db_pool"]
+    count = await retry_failed(db_pool, batch_id, None if user_id in ADMIN_IDS else user_id)
+    if not count:
+        await reply(update, context, "В этом пакете нечего повторять: он ещё в работе, без ошибок или не ваш.")
+        return
+    await reply(update, context, f"Повторяем элементы с ошибками: {count}.")
+    batch = await claim_batch(db_pool, batch_id)
+    if batch is not None:
+        start_batch(context.bot_data, batch)
+
 async def ai_fallback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("AI помощник завершен. Возвращайтесь, когда понадобится помощь!")
+    await reply(update, context, "AI помощник завершен. Возвращайтесь, когда понадобится помощь!")
     return ConversationHandler.END
 
 # Админские команды для управления моделями
 async def set_model_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if str(user_id) not in os.getenv("ADMIN_IDS", "").split(","):
-        await update.message.reply_text("❌ Доступно только администраторам!")
+    if user_id not in ADMIN_IDS:
+        await reply(update, context, "❌ Доступно только администраторам!")
         return
     
     if not context.args:
-        await update.message.reply_text("Использование: /set_model <название_модели>")
+        await reply(update, context, "Использование: /set_model <название_модели>")
         return
     
     model_name = context.args[0]
     success = await set_active_model(context.bot_data["db_pool"], model_name)
     
     if success:
-        await update.message.reply_text(f"✅ Модель успешно изменена на: {model_name}")
+        await context.bot_data["cluster"].publish("model")
+        await reply(update, context, f"✅ Модель успешно изменена на: {model_name}")
     else:
-        await update.message.reply_text("❌ Ошибка смены модели. Проверьте логи.")
+        await reply(update, context, "❌ Ошибка смены модели. Проверьте логи.")
 
 async def list_models_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if str(user_id) not in os.getenv("ADMIN_IDS", "").split(","):
-        await update.message.reply_text("❌ Доступно только администраторам!")
+    if user_id not in ADMIN_IDS:
+        await reply(update, context, "❌ Доступно только администраторам!")
         return
     
     async with context.bot_data["db_pool"].acquire() as conn:
@@ -239,7 +463,7 @@ async def list_models_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         status = "🟢 Активна" if model["is_active"] else "⚪️ Неактивна"
         response.append(f"- {model['model_name']} {status}")
     
-    await update.message.reply_text("\n".join(response))
+    await reply(update, context, "\n".join(response))
 
 ai_assistant_handler = ConversationHandler(
     entry_points=[CallbackQueryHandler(start_ai, pattern='^ai_assistant$')],
@@ -248,12 +472,24 @@ ai_assistant_handler = ConversationHandler(
         AI_SCRIPT_REVIEW_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_script_review)],
         AI_NEW_SCRIPT_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_new_script)],
         AI_EDITING_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_editing_assist)],
-        AI_DESCRIPTION_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_description_gen)]
+        AI_DESCRIPTION_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_description_gen)],
+        AI_BATCH_MODE: [CallbackQueryHandler(select_batch_mode, pattern='^ai_batch_mode_')],
+        AI_BATCH_FILE: [
+            MessageHandler(filters.Document.ALL, receive_batch_file),
+            MessageHandler(filters.TEXT & ~filters.COMMAND, batch_file_expected)
+        ]
     },
     fallbacks=[MessageHandler(filters.COMMAND, ai_fallback)]
 )
 
+def subscribe(cluster):
+    """Смена модели в другой реплике сбрасывает кэш и здесь"""
+    cluster.on("model", lambda event: reset_model_cache())
+    cluster.on("resync", lambda event: reset_model_cache())
+
 def add_handlers(app):
     app.add_handler(ai_assistant_handler)
     app.add_handler(CommandHandler("set_model", set_model_command))
     app.add_handler(CommandHandler("models", list_models_command))
+    app.add_handler(CommandHandler("ai_batches", ai_batches_command))
+    app.add_handler(CommandHandler("ai_batch_retry", ai_batch_retry_command))
@@ -0,0 +1,361 @@
+import asyncio
+import csv
+import io
+import logging
+import os
+import re
+import zipfile
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+AI_BATCH_MAX_ITEMS = 100
+AI_BATCH_MAX_FILE_BYTES = 2 * 1024 * 1024
+# Предел для распакованного архива, чтобы zip-бомба не заняла всю память
+AI_BATCH_MAX_UNPACKED_BYTES = 10 * 1024 * 1024
+AI_BATCH_MAX_ITEM_CHARS = 20000
+# Сколько запросов к API идёт одновременно во всех пакетах реплики
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "5"))
+AI_BATCH_RETRIES = 3
+AI_BATCH_BACKOFF = 2.0
+# Пакет закреплён за репликой, пока она продлевает аренду. Если реплика пропала,
+# после истечения аренды пакет подхватит другая и доделает незавершённые элементы
+AI_BATCH_LEASE = 120
+
+BATCH_FILE_EXTENSIONS = (".txt", ".csv", ".zip")
+ZIP_ITEM_EXTENSIONS = (".txt", ".md")
+# Колонки CSV, в которых ищем текст, если в файле есть заголовок
+CSV_TEXT_COLUMNS = ("text", "script", "topic", "текст", "сценарий", "тема")
+ITEM_SEPARATOR = re.compile(r'^\s*-{3,}\s*$', re.MULTILINE)
+# Режимы, в которых элемент — короткая тема, поэтому .txt без разделителей читается по строкам
+LINE_ITEM_MODES = frozenset({"new_script"})
+TITLE_LENGTH = 60
+
+
+class BatchFileError(ValueError):
+    """Файл нельзя превратить в пакет, текст ошибки показывается пользователю"""
+
+
+class PermanentError(Exception):
+    """Ошибка элемента, которую бесполезно повторять"""
+
+
+def _decode(data: bytes) -> str:
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1251", errors="replace")
+
+
+def _title(text: str) -> str:
+    line = text.strip().split("\n", 1)[0].strip()
+    return line if len(line) <= TITLE_LENGTH else line[:TITLE_LENGTH - 1] + "…"
+
+
+def _split_text(text: str, by_lines: bool) -> List[str]:
+    """Элементы разделены строкой ---, иначе пустой строкой, иначе это один текст
+    или, если by_lines, темы по одной на строку"""
+    text = text.replace("\r\n", "\n")
+    if ITEM_SEPARATOR.search(text):
+        parts = ITEM_SEPARATOR.split(text)
+    else:
+        parts = re.split(r'\n\s*\n', text)
+        if by_lines and len([part for part in parts if part.strip()]) == 1:
+            parts = text.split("\n")
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _split_csv(text: str) -> List[str]:
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    rows = [row for row in csv.reader(io.StringIO(text), dialect) if any(cell.strip() for cell in row)]
+    column = 0
+    if rows:
+        header = [cell.strip().lower() for cell in rows[0]]
+        for name in CSV_TEXT_COLUMNS:
+            if name in header:
+                column = header.index(name)
+                rows = rows[1:]
+                break
+    return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+
+
+def _split_zip(data: bytes) -> List[Tuple[str, str]]:
+    items, unpacked = [], 0
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise BatchFileError("Не удалось открыть архив.")
+    with archive:
+        for info in sorted(archive.infolist(), key=lambda info: info.filename):
+            name = os.path.basename(info.filename)
+            if info.is_dir() or name.startswith(".") or "__MACOSX" in info.filename:
+                continue
+            if not name.lower().endswith(ZIP_ITEM_EXTENSIONS):
+                continue
+            # Размеру из заголовка архива не верим, читаем не больше оставшегося лимита
+            with archive.open(info) as file:
+                content = file.read(AI_BATCH_MAX_UNPACKED_BYTES - unpacked + 1)
+            unpacked += len(content)
+            if unpacked > AI_BATCH_MAX_UNPACKED_BYTES:
+                raise BatchFileError(f"Архив больше {AI_BATCH_MAX_UNPACKED_BYTES // (1024 * 1024)} МБ после распаковки.")
+            text = _decode(content).strip()
+            if text:
+                items.append((os.path.splitext(name)[0], text))
+    return items
+
+
+def parse_batch_file(filename: str, data: bytes, mode: str) -> List[Tuple[str, str]]:
+    """Разбирает файл на элементы (заголовок, текст).
+
+    .txt — элементы через строку --- или пустую строку, иначе весь файл — один элемент,
+    а в режимах LINE_ITEM_MODES — по одному на строку;
+    .csv — колонка text/сценарий/тема или первая колонка; .zip — каждый .txt/.md файл.
+    """
+    extension = os.path.splitext(filename.lower())[1]
+    if extension == ".txt":
+        items = [(_title(text), text) for text in _split_text(_decode(data), mode in LINE_ITEM_MODES)]
+    elif extension == ".csv":
+        items = [(_title(text), text) for text in _split_csv(_decode(data))]
+    elif extension == ".zip":
+        items = _split_zip(data)
+    else:
+        raise BatchFileError("Поддерживаются файлы .txt, .csv и .zip.")
+
+    if not items:
+        raise BatchFileError("В файле не нашлось ни одного текста.")
+    if len(items) > AI_BATCH_MAX_ITEMS:
+        raise BatchFileError(f"Слишком много элементов: {len(items)}, максимум {AI_BATCH_MAX_ITEMS}.")
+    for position, (title, text) in enumerate(items, start=1):
+        if len(text) > AI_BATCH_MAX_ITEM_CHARS:
+            raise BatchFileError(
+                f"Элемент {position} «{title}» длиннее {AI_BATCH_MAX_ITEM_CHARS} символов."
+            )
+    return items
+
+
+async def create_batch(db_pool: asyncpg.Pool, user_id: int, chat_id: int, mode: str, filename: str,
+                       items: List[Tuple[str, str]]) -> asyncpg.Record:
+    """Сохраняет пакет сразу закреплённым за этой репликой"""
+    async with db_pool.acquire() as conn:
+        async with conn.transaction():
+            batch = await conn.fetchrow(
+                """
+                INSERT INTO ai_batches (user_id, chat_id, mode, filename, leased_until)
+                VALUES ($1, $2, $3, $4, now() + make_interval(secs => $5))
+                RETURNING id, user_id, chat_id, mode, filename
+                """,
+                user_id, chat_id, mode, filename, AI_BATCH_LEASE
+            )
+            await conn.execute(
+                """
+                INSERT INTO ai_batch_items (batch_id, position, title, input)
+                SELECT $1, position, title, input
+                FROM unnest($2::text[], $3::text[]) WITH ORDINALITY AS item (title, input, position)
+                """,
+                batch["id"], [title for title, _ in items], [text for _, text in items]
+            )
+    return batch
+
+
+async def claim_batch(db_pool: asyncpg.Pool, batch_id: int) -> Optional[asyncpg.Record]:
+    """Забирает незавершённый пакет, если его аренда свободна или истекла"""
+    async with db_pool.acquire() as conn:
+        return await conn.fetchrow(
+            """
+            UPDATE ai_batches SET leased_until = now() + make_interval(secs => $2)
+            WHERE id = $1 AND status = 'running' AND (leased_until IS NULL OR leased_until < now())
+            RETURNING id, user_id, chat_id, mode, filename
+            """,
+            batch_id, AI_BATCH_LEASE
+        )
+
+
+async def stalled_batches(db_pool: asyncpg.Pool) -> List[int]:
+    """Незавершённые пакеты, которые никто не обрабатывает"""
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT id FROM ai_batches
+            WHERE status = 'running' AND (leased_until IS NULL OR leased_until < now())
+            ORDER BY id
+            """
+        )
+    return [row["id"] for row in rows]
+
+
+async def retry_failed(db_pool: asyncpg.Pool, batch_id: int, user_id: Optional[int] = None) -> int:
+    """Возвращает завершённый пакет в работу, сбросив ошибки элементов. Возвращает их число.
+
+    user_id — владелец пакета, None — любой (для админов).
+    """
+    async with db_pool.acquire() as conn:
+        async with conn.transaction():
+            reopened = await conn.fetchval(
+                """
+                UPDATE ai_batches SET status = 'running', finished_at = NULL
+                WHERE id = $1 AND status = 'done' AND ($2::bigint IS NULL OR user_id = $2)
+                  AND EXISTS (SELECT 1 FROM ai_batch_items WHERE batch_id = $1 AND error IS NOT NULL)
+                RETURNING id
+                """,
+                batch_id, user_id
+            )
+            if reopened is None:
+                return 0
+            status = await conn.execute(
+                "UPDATE ai_batch_items SET error = NULL WHERE batch_id = $1 AND error IS NOT NULL",
+                batch_id
+            )
+    return int(status.split()[-1])
+
+
+async def list_batches(db_pool: asyncpg.Pool, user_id: int, limit: int = 10) -> List[asyncpg.Record]:
+    async with db_pool.acquire() as conn:
+        return await conn.fetch(
+            """
+            SELECT b.id, b.mode, b.filename, b.status, b.created_at,
+                   count(i.output) AS done, count(i.error) AS failed, count(*) AS total
+            FROM ai_batches b
+            JOIN ai_batch_items i ON i.batch_id = b.id
+            WHERE b.user_id = $1
+            GROUP BY b.id
+            ORDER BY b.id DESC
+            LIMIT $2
+            """,
+            user_id, limit
+        )
+
+
+async def batch_counts(conn: asyncpg.Connection, batch_id: int) -> Tuple[int, int, int]:
+    """(готово, ошибок, всего)"""
+    row = await conn.fetchrow(
+        """
+        SELECT count(output) AS done, count(error) AS failed, count(*) AS total
+        FROM ai_batch_items WHERE batch_id = $1
+        """,
+        batch_id
+    )
+    return row["done"], row["failed"], row["total"]
+
+
+async def _keep_lease(db_pool: asyncpg.Pool, batch_id: int):
+    while True:
+        await asyncio.sleep(AI_BATCH_LEASE / 3)
+        async with db_pool.acquire() as conn:
+            await conn.execute(
+                "UPDATE ai_batches SET leased_until = now() + make_interval(secs => $2) WHERE id = $1",
+                batch_id, AI_BATCH_LEASE
+            )
+
+
+async def _run_item(call: Callable[[str], Awaitable[str]], semaphore: asyncio.Semaphore,
+                    text: str) -> Tuple[Optional[str], Optional[str], int]:
+    """(ответ, ошибка, число попыток). Между попытками слот семафора свободен"""
+    for attempt in range(1, AI_BATCH_RETRIES + 1):
+        try:
+            async with semaphore:
+                return await call(text), None, attempt
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if isinstance(e, PermanentError) or attempt == AI_BATCH_RETRIES:
+                return None, error, attempt
+            logger.warning(f"Попытка {attempt} не удалась: {error}")
+            await asyncio.sleep(AI_BATCH_BACKOFF * 2 ** (attempt - 1))
+
+
+async def run_batch(db_pool: asyncpg.Pool, batch_id: int, call: Callable[[str], Awaitable[str]],
+                    semaphore: asyncio.Semaphore,
+                    on_progress: Callable[[int, int, int], Awaitable[None]]) -> Tuple[int, int, int]:
+    """Обрабатывает элементы без ответа и без ошибки, сохраняя каждый результат сразу.
+
+    Пакет должен быть уже закреплён за репликой (create_batch или claim_batch).
+    При отмене аренда снимается, и пакет можно сразу продолжить в другой реплике.
+    Возвращает (готово, ошибок, всего).
+    """
+    async with db_pool.acquire() as conn:
+        items = await conn.fetch(
+            """
+            SELECT position, input FROM ai_batch_items
+            WHERE batch_id = $1 AND output IS NULL AND error IS NULL
+            ORDER BY position
+            """,
+            batch_id
+        )
+        done, failed, total = await batch_counts(conn, batch_id)
+
+    async def process(position: int, text: str):
+        nonlocal done, failed
+        output, error, attempts = await _run_item(call, semaphore, text)
+        async with db_pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE ai_batch_items SET output = $3, error = $4, attempts = attempts + $5
+                WHERE batch_id = $1 AND position = $2
+                """,
+                batch_id, position, output, error, attempts
+            )
+        if output is None:
+            failed += 1
+        else:
+            done += 1
+        await on_progress(done, failed, total)
+
+    lease = asyncio.create_task(_keep_lease(db_pool, batch_id))
+    tasks = [asyncio.ensure_future(process(item["position"], item["input"])) for item in items]
+    finished = False
+    try:
+        await asyncio.gather(*tasks)
+        finished = True
+    finally:
+        # Без аренды пакет может забрать другая реплика, поэтому здесь ничего не должно остаться
+        for task in tasks:
+            task.cancel()
+        lease.cancel()
+        async with db_pool.acquire() as conn:
+            if finished:
+                await conn.execute(
+                    """
+                    UPDATE ai_batches SET status = 'done', finished_at = now(), leased_until = NULL
+                    WHERE id = $1
+                    """,
+                    batch_id
+                )
+            else:
+                await conn.execute("UPDATE ai_batches SET leased_until = NULL WHERE id = $1", batch_id)
+    return done, failed, total
+
+
+async def render_results(db_pool: asyncpg.Pool, batch: asyncpg.Record, mode_title: str) -> bytes:
+    """Один текстовый файл со всеми ответами пакета в исходном порядке"""
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT position, title, input, output, error, attempts FROM ai_batch_items
+            WHERE batch_id = $1 ORDER BY position
+            """,
+            batch["id"]
+        )
+    failed = sum(1 for row in rows if row["output"] is None)
+    lines = [
+        f"Пакет #{batch['id']}: {mode_title}, файл {batch['filename']}",
+        f"Готово: {len(rows) - failed} из {len(rows)}, ошибок: {failed}",
+        ""
+    ]
+    for row in rows:
+        lines.append(f"===== {row['position']}. {row['title']} =====")
+        lines.append("")
+        if row["output"] is not None:
+            lines.append(row["output"])
+        else:
+            lines.append(f"ОШИБКА после {row['attempts']} попыток: {row['error'] or 'не обработан'}")
+        lines.append("")
+        lines.append("----- Исходный текст -----")
+        lines.append(row["input"])
+        lines.append("")
+    return "\n".join(lines).encode("utf-8")
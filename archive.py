@@ -0,0 +1,75 @@
+import asyncio
+from typing import Optional, Tuple
+
+import asyncpg
+
+from exports import render_videos_csv
+from schema import partition_name
+
+
+async def archive_category(db_pool: asyncpg.Pool, category: str, archived_by: int) -> Tuple[int, int]:
+    """Переносит живые данные категории в архив одной транзакцией.
+
+    Секции категории копируются в архив и очищаются TRUNCATE, так что в живых
+    таблицах не остаётся мёртвых строк. Возвращает (id сессии, количество видео).
+    """
+    async with db_pool.acquire() as conn:
+        async with conn.transaction():
+            videos = await partition_name(conn, "videos", category)
+            ratings = await partition_name(conn, "user_ratings", category)
+            if videos is None or not await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", videos):
+                raise ValueError(f"У категории {category} нет секций")
+
+            # Порядок блокировок тот же, что у хендлеров: сначала videos, потом user_ratings
+            await conn.execute(f"LOCK TABLE {videos}, {ratings} IN ACCESS EXCLUSIVE MODE")
+
+            session_id = await conn.fetchval(
+                "INSERT INTO sessions (category, archived_by) VALUES ($1, $2) RETURNING id",
+                category, archived_by
+            )
+            status = await conn.execute(
+                f"""
+                INSERT INTO videos_archive
+                    (session_id, link, author_comment, total_score, ratings_count, avg_score, comments)
+                SELECT $1, link, author_comment, total_score, ratings_count, avg_score, comments FROM {videos}
+                """,
+                session_id
+            )
+            videos_count = int(status.split()[-1])
+            await conn.execute(
+                f"""
+                INSERT INTO user_ratings_archive (session_id, user_id, video_link)
+                SELECT $1, user_id, video_link FROM {ratings}
+                """,
+                session_id
+            )
+            await conn.execute(f"TRUNCATE {videos}, {ratings}")
+            await conn.execute(
+                "UPDATE sessions SET videos_count = $1 WHERE id = $2",
+                videos_count, session_id
+            )
+    return session_id, videos_count
+
+
+async def list_sessions(db_pool: asyncpg.Pool, limit: int = 20):
+    async with db_pool.acquire() as conn:
+        return await conn.fetch(
+            """
+            SELECT id, category, archived_at, videos_count FROM sessions
+            ORDER BY id DESC LIMIT $1
+            """,
+            limit
+        )
+
+
+async def session_export(db_pool: asyncpg.Pool, session_id: int) -> Optional[Tuple[str, bytes]]:
+    """Выгрузка архивной сессии в том же формате, что и живой таблицы"""
+    async with db_pool.acquire() as conn:
+        category = await conn.fetchval("SELECT category FROM sessions WHERE id = $1", session_id)
+        if category is None:
+            return None
+        rows = await conn.fetch(
+            "SELECT link, avg_score, ratings_count, comments FROM videos_archive WHERE session_id = $1",
+            session_id
+        )
+    return category, await asyncio.to_thread(render_videos_csv, rows)
@@ -0,0 +1,75 @@
+"""Время импорта бота по python -X importtime и проверка бюджета.
+
+Запуск: python benchmarks/import_benchmark.py [--budget-ms 800]
+Код выхода 1, если медиана превышает бюджет или при старте загружаются
+тяжёлые зависимости, которые должны импортироваться при первом использовании.
+Те же проверки выполняет tests/test_import_budget.py.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MODULE = "bot_pg"
+
+# Эти модули нужны только выгрузкам и AI помощнику
+LAZY_MODULES = ("pandas", "numpy", "aiohttp")
+
+DEFAULT_BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", "800"))
+
+
+def run_once():
+    """Возвращает {модуль: накопленное время в мкс} для одного холодного импорта"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-c", f"import {MODULE}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Модуль может встретиться несколько раз, нас интересует первый (реальный) импорт
+        timings.setdefault(name.strip(), int(cumulative))
+    return timings
+
+
+def measure(runs: int):
+    """Медиана времени импорта в мс и времена модулей последнего запуска"""
+    results = [run_once() for _ in range(runs)]
+    return statistics.median(result[MODULE] for result in results) / 1000, results[-1]
+
+
+def loaded_lazy_modules(timings):
+    return [name for name in LAZY_MODULES if name in timings]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=int, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="сколько самых дорогих модулей показать")
+    args = parser.parse_args()
+
+    total_ms, last = measure(args.runs)
+    print(f"import {MODULE}: медиана {total_ms:.1f} мс за {args.runs} запусков (бюджет {args.budget_ms} мс)")
+    print("Самые дорогие модули верхнего уровня:")
+    top_level = {name: us for name, us in last.items() if "." not in name and name != MODULE}
+    for name, us in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {name:<24} {us / 1000:8.1f} мс")
+
+    failed = False
+    loaded = loaded_lazy_modules(last)
+    if loaded:
+        print(f"ОШИБКА: при старте импортируются {', '.join(loaded)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"ОШИБКА: импорт дольше бюджета на {total_ms - args.budget_ms:.1f} мс")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
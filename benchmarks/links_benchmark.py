@@ -0,0 +1,120 @@
+"""Извлечение и нормализация ссылок на корпусе из 100k ссылок разного вида.
+
+Запуск: python benchmarks/links_benchmark.py [--links 100000]
+Сравнивает прежний разбор (split + URL_REGEX.match по каждому слову) с links.extract_links.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from links import extract_links  # noqa: E402
+
+# Регулярка из bot_pg.py до перехода на links.py
+LEGACY_URL_REGEX = re.compile(
+    r'^https?://(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.'
+    r'[a-zA-Z0-9()]{1,6}\b(?:[-a-zA-Z0-9()@:%_\+.~#?&//=]*)$'
+)
+
+ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-"
+WORDS = ["вот", "ещё", "видео", "глянь", "новое", "для", "сессии", "ок", "—", "и"]
+
+
+def youtube(rng, video_id):
+    return rng.choice([
+        f"https://youtu.be/{video_id}",
+        f"https://youtu.be/{video_id}?si={rng.randrange(10 ** 8)}",
+        f"https://www.youtube.com/watch?v={video_id}",
+        f"https://m.youtube.com/watch?v={video_id}&feature=share",
+        f"https://youtube.com/shorts/{video_id}/",
+        f"http://www.youtube.com/shorts/{video_id}?utm_source=tg"
+    ])
+
+
+def instagram(rng, video_id):
+    return rng.choice([
+        f"https://www.instagram.com/reel/{video_id}/",
+        f"https://instagram.com/reel/{video_id}/?igsh={rng.randrange(10 ** 8)}",
+        f"https://www.instagram.com/p/{video_id}"
+    ])
+
+
+def tiktok(rng, video_id):
+    number = int.from_bytes(video_id.encode()[:8], "big")
+    return rng.choice([
+        f"https://www.tiktok.com/@creator/video/{number}",
+        f"https://www.tiktok.com/@creator/video/{number}?is_from_webapp=1&sender_device=pc",
+        f"https://m.tiktok.com/@creator/video/{number}/"
+    ])
+
+
+def generic(rng, video_id):
+    return rng.choice([
+        f"https://example.com/videos/{video_id}",
+        f"https://www.example.com/videos/{video_id}/?utm_source=tg&utm_medium=chat",
+        f"https://example.com/videos/{video_id}#t=10"
+    ])
+
+
+def make_corpus(links: int, unique: int, seed: int = 42):
+    """Сообщения по ~20 ссылок вперемешку со словами и пунктуацией"""
+    rng = random.Random(seed)
+    ids = ["".join(rng.choice(ID_ALPHABET) for _ in range(11)) for _ in range(unique)]
+    platforms = [youtube, instagram, tiktok, generic]
+    videos = [(rng.choice(platforms), video_id) for video_id in ids]
+
+    messages, current = [], []
+    for _ in range(links):
+        platform, video_id = rng.choice(videos)
+        link = platform(rng, video_id)
+        current.append(rng.choice(WORDS))
+        current.append(link + rng.choice(["", "", ",", ".", ")"]))
+        if len(current) >= 40:
+            messages.append(" ".join(current))
+            current = []
+    if current:
+        messages.append(" ".join(current))
+    return messages
+
+
+def legacy(messages):
+    links = []
+    for text in messages:
+        links.extend(token.strip() for token in text.split() if LEGACY_URL_REGEX.match(token))
+    return links
+
+
+def pipeline(messages):
+    links = []
+    for text in messages:
+        links.extend(extract_links(text))
+    return links
+
+
+def bench(name, func, messages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        links = func(messages)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<10} {best * 1000:8.1f} мс, найдено {len(links):6d}, различных ключей {len(set(links)):6d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--links", type=int, default=100_000)
+    parser.add_argument("--unique", type=int, default=20_000, help="сколько разных видео в корпусе")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    messages = make_corpus(args.links, args.unique)
+    print(f"{len(messages)} сообщений, {args.links} ссылок на {args.unique} видео")
+    bench("legacy", legacy, messages, args.repeat)
+    bench("pipeline", pipeline, messages, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Задержка запросов одной категории, пока растут остальные.
+
+Запуск: DATABASE_URL=postgresql://... python benchmarks/partition_benchmark.py
+Всё создаётся в отдельной схеме bench_partitions, которая удаляется в конце.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from schema import ensure_partitions, init_schema  # noqa: E402
+
+SCHEMA = "bench_partitions"
+TARGET = "target"
+TARGET_VIDEOS = 5000
+TARGET_USERS = 50
+OTHER_USERS = 5
+
+# Те же запросы, что выполняют хендлеры bot_pg.py
+QUERIES = {
+    "ask_for_rating": (
+        """
+        SELECT link FROM videos
+        WHERE category = $2
+          AND link NOT IN (
+              SELECT video_link FROM user_ratings
+              WHERE user_id = $1 AND category = $2
+          )
+        ORDER BY random() LIMIT 1
+        """,
+        lambda i: (i % TARGET_USERS, TARGET)
+    ),
+    "receive_rating": (
+        """
+        UPDATE videos
+        SET total_score = total_score + 5,
+            ratings_count = ratings_count + 1,
+            avg_score = (total_score + 5)::FLOAT / (ratings_count + 1)
+        WHERE link = $1 AND category = $2
+        """,
+        lambda i: (f"https://example.com/{TARGET}/{i % TARGET_VIDEOS}", TARGET)
+    ),
+    "download_by_category": (
+        "SELECT link, avg_score, ratings_count, comments FROM videos WHERE category = $1",
+        lambda i: (TARGET,)
+    )
+}
+
+
+async def fill_category(conn, category: str, videos: int, users: int):
+    async with conn.transaction():
+        await conn.execute("INSERT INTO categories (name) VALUES ($1) ON CONFLICT DO NOTHING", category)
+        await ensure_partitions(conn, category)
+    await conn.execute(
+        """
+        INSERT INTO videos (link, category, total_score, ratings_count, avg_score, comments)
+        SELECT 'https://example.com/' || $1 || '/' || i, $1, i % 50, i % 7, (i % 10)::FLOAT, ARRAY['ok']
+        FROM generate_series(0, $2 - 1) AS i
+        """,
+        category, videos
+    )
+    # Каждый пользователь оценил каждое третье видео
+    await conn.execute(
+        """
+        INSERT INTO user_ratings (user_id, video_link, category)
+        SELECT u, 'https://example.com/' || $1 || '/' || i, $1
+        FROM generate_series(0, $3 - 1) AS u, generate_series(0, $2 - 1, 3) AS i
+        """,
+        category, videos, users
+    )
+
+
+async def measure(conn, iterations: int):
+    results = {}
+    for name, (sql, args) in QUERIES.items():
+        run = conn.execute if sql.lstrip().startswith("UPDATE") else conn.fetch
+        timings = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            await run(sql, *args(i))
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = (statistics.median(timings), timings[int(len(timings) * 0.95) - 1])
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, nargs="+", default=[0, 100_000, 500_000, 1_000_000],
+                        help="сколько видео в остальных категориях на каждом шаге")
+    parser.add_argument("--categories", type=int, default=10, help="число остальных категорий")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+        # pg_trgm может быть уже установлен в public
+        await conn.execute(f"SET search_path TO {SCHEMA}, public")
+        await init_schema(conn)
+        await fill_category(conn, TARGET, TARGET_VIDEOS, TARGET_USERS)
+
+        filled = 0
+        print(f"{'остальные видео':>16} | " + " | ".join(f"{name:>28}" for name in QUERIES))
+        for total in args.steps:
+            per_category = (total - filled) // args.categories
+            if per_category > 0:
+                for n in range(args.categories):
+                    await fill_category(conn, f"other_{n}_{filled}", per_category, OTHER_USERS)
+                filled = total
+            await conn.execute("ANALYZE")
+            results = await measure(conn, args.iterations)
+            print(f"{filled:>16} | " + " | ".join(
+                f"p50 {p50:7.2f} мс, p95 {p95:7.2f} мс" for p50, p95 in results.values()
+            ))
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
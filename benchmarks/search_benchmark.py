@@ -0,0 +1,133 @@
+"""Задержка inline-поиска по видео и комментариям на миллионе комментариев.
+
+Запуск: DATABASE_URL=postgresql://... python benchmarks/search_benchmark.py [--budget-ms 100]
+Всё создаётся в отдельной схеме bench_search, которая удаляется в конце.
+Запросы идут мимо кэша VideoSearch, то есть это время первого нажатия клавиши.
+Код выхода 1, если p95 по всем запросам превышает бюджет.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+import asyncpg
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from schema import ensure_partitions, init_schema  # noqa: E402
+from search import SEARCH_SQL, _like_pattern  # noqa: E402
+
+SCHEMA = "bench_search"
+VOCABULARY = 5000
+WORDS_PER_COMMENT = 6
+
+
+def make_vocabulary(rng):
+    alphabet = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя" + string.ascii_lowercase
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(4, 9))) for _ in range(VOCABULARY)]
+
+
+def make_videos(rng, words, category: str, videos: int, comments: int):
+    for i in range(videos):
+        yield (
+            f"https://example.com/{category}/{i}",
+            category,
+            " ".join(rng.choices(words, k=WORDS_PER_COMMENT)) if i % 2 else None,
+            [" ".join(rng.choices(words, k=WORDS_PER_COMMENT)) for _ in range(comments)],
+            rng.randint(0, 10),
+            rng.uniform(1, 10)
+        )
+
+
+def make_queries(rng, words, categories, videos: int):
+    """Запросы разного вида: частое слово, его начало, фрагмент ссылки, целая категория и то, чего нет"""
+    return {
+        "слово": [rng.choice(words) for _ in range(200)],
+        "начало слова": [rng.choice(words)[:3] for _ in range(200)],
+        "ссылка": [f"{rng.choice(categories)}/{rng.randrange(videos)}" for _ in range(200)],
+        "два слова": [" ".join(rng.choices(words, k=2)) for _ in range(200)],
+        "вся категория": [f"example.com/{rng.choice(categories)}/" for _ in range(200)],
+        "нет совпадений": ["".join(rng.choices("xyzq", k=8)) for _ in range(200)]
+    }
+
+
+async def measure(conn, queries):
+    timings, found = [], []
+    for query in queries:
+        started = time.perf_counter()
+        rows = await conn.fetch(SEARCH_SQL, _like_pattern(query))
+        timings.append((time.perf_counter() - started) * 1000)
+        found.append(len(rows))
+    return timings, found
+
+
+async def plan_kind(conn, query) -> str:
+    """Как Postgres ищет совпадения: по триграммам, по индексу оценки или полным проходом"""
+    plan = "\n".join(row[0] for row in await conn.fetch("EXPLAIN " + SEARCH_SQL, _like_pattern(query)))
+    if "Bitmap Index Scan" in plan:
+        return "триграммы"
+    if "avg_score_ratings_count_link_idx" in plan:
+        return "по оценке"
+    return "ПОЛНЫЙ ПРОХОД"
+
+
+def percentile(timings, share):
+    ordered = sorted(timings)
+    return ordered[max(int(len(ordered) * share) - 1, 0)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--videos", type=int, default=100_000)
+    parser.add_argument("--comments", type=int, default=10, help="комментариев на видео")
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    words = make_vocabulary(rng)
+    categories = [f"cat{n}" for n in range(args.categories)]
+    per_category = args.videos // args.categories
+
+    conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+    try:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+        # pg_trgm может быть уже установлен в public
+        await conn.execute(f"SET search_path TO {SCHEMA}, public")
+        await init_schema(conn)
+
+        started = time.perf_counter()
+        for category in categories:
+            async with conn.transaction():
+                await conn.execute("INSERT INTO categories (name) VALUES ($1)", category)
+                await ensure_partitions(conn, category)
+            await conn.copy_records_to_table(
+                "videos", schema_name=SCHEMA,
+                columns=["link", "category", "author_comment", "comments", "ratings_count", "avg_score"],
+                records=make_videos(rng, words, category, per_category, args.comments)
+            )
+        await conn.execute("ANALYZE")
+        print(f"{per_category * len(categories)} видео, {per_category * len(categories) * args.comments} "
+              f"комментариев, загрузка с индексом {time.perf_counter() - started:.1f} с")
+
+        everything = []
+        for kind, queries in make_queries(rng, words, categories, per_category).items():
+            timings, found = await measure(conn, queries)
+            everything.extend(timings)
+            print(f"{kind:<16} p50 {statistics.median(timings):7.2f} мс, p95 {percentile(timings, 0.95):7.2f} мс, "
+                  f"max {max(timings):7.2f} мс, найдено в среднем {statistics.mean(found):6.1f}, "
+                  f"план: {await plan_kind(conn, queries[0])}")
+
+        p95 = percentile(everything, 0.95)
+        print(f"{'все запросы':<16} p95 {p95:.2f} мс (бюджет {args.budget_ms} мс)")
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+    sys.exit(1 if p95 > args.budget_ms else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
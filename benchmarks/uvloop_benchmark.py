@@ -0,0 +1,113 @@
+"""Пропускная способность обработки апдейтов со стандартным циклом asyncio и с uvloop.
+
+Запуск: python benchmarks/uvloop_benchmark.py [--updates 20000]
+Сеть не нужна: запросы к Bot API обслуживает заглушка, поэтому измеряется сама
+обработка апдейта в PTB (разбор, диспетчеризация, сериализация ответа) и event loop.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+class FakeRequest(BaseRequest):
+    """Отвечает на запросы Bot API без сети, с небольшой задержкой как у настоящего запроса"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if url.endswith("/getMe"):
+            result = BOT_USER
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            params = request_data.parameters if request_data else {}
+            result = {
+                "message_id": 1, "date": 0, "text": params.get("text", ""),
+                "chat": {"id": params.get("chat_id", 0), "type": "private"}
+            }
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def make_update(update_id: int) -> dict:
+    user = {"id": 1000 + update_id % 500, "is_bot": False, "first_name": "user"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": f"https://example.com/video/{update_id}",
+            "chat": {"id": user["id"], "type": "private"}, "from": user
+        }
+    }
+
+
+async def echo(update, context):
+    await update.message.reply_text(update.message.text)
+
+
+async def run(updates: int, concurrency: int, latency: float) -> float:
+    app = (
+        ApplicationBuilder()
+        .token("1:bench")
+        .request(FakeRequest(latency))
+        .concurrent_updates(concurrency)
+        .build()
+    )
+    app.add_handler(MessageHandler(filters.TEXT, echo))
+    raw = [make_update(i) for i in range(updates)]
+
+    await app.initialize()
+    await app.start()
+    started = time.perf_counter()
+    for data in raw:
+        await app.update_queue.put(Update.de_json(data, app.bot))
+    await app.stop()
+    elapsed = time.perf_counter() - started
+    await app.shutdown()
+    return updates / elapsed
+
+
+def measure(name: str, args) -> float:
+    rates = [asyncio.run(run(args.updates, args.concurrency, args.latency)) for _ in range(args.repeat)]
+    rate = statistics.median(rates)
+    print(f"{name:<8} {rate:10.0f} апдейтов/с (медиана из {args.repeat})")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=256, help="concurrent_updates приложения")
+    parser.add_argument("--latency", type=float, default=0.001, help="задержка ответа Bot API, с")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = measure("asyncio", args)
+    try:
+        import uvloop
+    except ImportError:
+        print("uvloop не установлен")
+        return
+    # Так же, как install_uvloop в bot_pg.py
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    fast = measure("uvloop", args)
+    asyncio.set_event_loop_policy(None)
+    print(f"ускорение: x{fast / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
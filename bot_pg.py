@@ -1,19 +1,40 @@
 import os
-import re
+import asyncio
+import hashlib
 import asyncpg
-import pandas as pd
-from tempfile import NamedTemporaryFile
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, InputFile
+from urllib.parse import urlsplit
+from telegram import (
+    InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent, Update, InputFile
+)
 from telegram.ext import (
-    CallbackQueryHandler, MessageHandler, CommandHandler,
+    CallbackQueryHandler, MessageHandler, CommandHandler, InlineQueryHandler,
     ConversationHandler, filters, ContextTypes, ApplicationBuilder
 )
 from dotenv import load_dotenv
-from ai_assistant import add_handlers as add_ai_handlers
+from ai_assistant import (
+    add_handlers as add_ai_handlers, cancel_batches, close_http_session, subscribe as subscribe_ai
+)
+from outbox import GLOBAL_BURST, GLOBAL_RATE, Outbox, reply, reply_document
+from admins import ADMIN_IDS, grant_admin, load_admins, subscribe as subscribe_admins
+from cluster import Cluster
+from schema import init_schema
+from archive import archive_category, list_sessions, session_export
+from categories import CategoryRegistry
+from exports import get_export
+from jobs import schedule_jobs
+from links import extract_links
+from leaderboard import Leaderboard, TOP_CAPACITY, TOP_DEFAULT_K, TOP_MIN_RATINGS
+from search import SEARCH_CACHE_TTL, VideoSearch
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
-ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().isdigit()]
+
+# Сколько реплик бота запущено: на них делится общий лимит отправки Telegram
+REPLICAS = max(1, int(os.getenv("REPLICAS", "1")))
+# С вебхуком апдейты приходят через router.py, без него бот сам опрашивает getUpdates
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
 
 (
     WAITING_VIDEO_LINKS,
@@ -22,101 +43,125 @@ ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().
     WAITING_AUTHOR_COMMENT
 ) = range(4)
 
-URL_REGEX = re.compile(
-    r'^https?://(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.'
-    r'[a-zA-Z0-9()]{1,6}\b(?:[-a-zA-Z0-9()@:%_\+.~#?&//=]*)$'
-)
+# Кнопки меню, по которым пользователь уходит из загрузки или оценки
+MENU_CALLBACKS = "^(creative_session|ai_assistant|back_to_start|start_review|send_video_prompt)$"
+# Через сколько секунд бездействия диалог загрузки или оценки завершается сам
+SESSION_TIMEOUT = 15 * 60
+# Диалог сессии в своей группе: кнопки меню обрабатываются в группе 0 и заодно завершают его
+SESSION_GROUP = 1
 
 async def init_db_pool():
     return await asyncpg.create_pool(DATABASE_URL)
 
 async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.answer()
+    if update.callback_query:
+        await update.callback_query.answer()
     markup = InlineKeyboardMarkup([
         [InlineKeyboardButton("⬅️ Назад", callback_data='back_to_start')]
     ])
-    await update.callback_query.message.reply_text("Выберите режим:", reply_markup=markup)
+    await reply(update, context, "Выберите режим:", reply_markup=markup)
 
 async def creative_session_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
     markup = InlineKeyboardMarkup([
         [InlineKeyboardButton("🎥 Отправить видео", callback_data='send_video_prompt')],
         [InlineKeyboardButton("⭐ Начать оценку", callback_data='start_review')],
+        [InlineKeyboardButton("🏆 Лидеры", callback_data='top')],
         [InlineKeyboardButton("📥 Скачать таблицу", callback_data='download')],
         [InlineKeyboardButton("🧹 Очистить таблицу", callback_data='clear_table')],
         [InlineKeyboardButton("❓ Помощь", callback_data='help')],
         [InlineKeyboardButton("⬅️ Назад", callback_data='back_to_start')]
     ])
-    await update.callback_query.message.reply_text("Добро пожаловать в Креативную сессию!", reply_markup=markup)
+    await reply(update, context, "Добро пожаловать в Креативную сессию!", reply_markup=markup)
 
 creative_session_handler = CallbackQueryHandler(creative_session_menu, pattern='^creative_session$')
 
 async def send_video_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    keyboard = [
-        [InlineKeyboardButton("qeep", callback_data="video_cat_qeep")],
-        [InlineKeyboardButton("Harley", callback_data="video_cat_Harley")],
-        [InlineKeyboardButton("Алтея", callback_data="video_cat_Алтея")]
-    ]
-    await update.callback_query.message.reply_text("Выберите категорию для отправки видео:", reply_markup=InlineKeyboardMarkup(keyboard))
+    registry = context.bot_data["categories"]
+    await reply(
+        update, context,
+        f"Выберите категорию для отправки видео:\n\n{registry.summary()}",
+        reply_markup=registry.keyboard("video_cat_")
+    )
     return ConversationHandler.END
 
 async def select_video_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    category = update.callback_query.data.split("_")[-1]
+    category = context.bot_data["categories"].parse(update.callback_query.data, "video_cat_")
+    if not category:
+        await reply(update, context, "Эта категория больше недоступна.")
+        return ConversationHandler.END
     context.user_data["category"] = category
-    await update.callback_query.message.reply_text("Отправьте ссылки через пробел:")
+    await reply(update, context, "Отправьте одну или несколько ссылок:")
     return WAITING_VIDEO_LINKS
 
 async def receive_video_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.text:
-        await update.message.reply_text("Ошибка: отправьте текст со ссылками!")
+        await reply(update, context, "Ошибка: отправьте текст со ссылками!")
         return WAITING_VIDEO_LINKS
 
-    tokens = update.message.text.split()
-    valid_links = [token.strip() for token in tokens if URL_REGEX.match(token)]
+    # Ссылки уже в каноническом виде и без повторов внутри сообщения
+    valid_links = extract_links(update.message.text)
 
     if not valid_links:
-        await update.message.reply_text("Не найдено ни одной корректной ссылки!")
+        await reply(update, context, "Не найдено ни одной корректной ссылки!")
         return WAITING_VIDEO_LINKS
 
     db_pool = context.bot_data.get("db_pool")
     if not db_pool:
-        await update.message.reply_text("Ошибка подключения к БД!")
+        await reply(update, context, "Ошибка подключения к БД!")
         return ConversationHandler.END
 
     category = context.user_data.get("category")
     async with db_pool.acquire() as conn:
-        for link in valid_links:
-            await conn.execute(
-                "INSERT INTO videos (link, category) VALUES ($1, $2) ON CONFLICT (link, category) DO NOTHING",
-                link, category
-            )
+        inserted = await conn.fetch(
+            """
+            INSERT INTO videos (link, category)
+            SELECT unnest($1::text[]), $2
+            ON CONFLICT (link, category) DO NOTHING
+            RETURNING link
+            """,
+            valid_links, category
+        )
+    context.bot_data["categories"].videos_added(category, len(inserted))
+    if inserted:
+        await context.bot_data["cluster"].publish("videos", category=category, count=len(inserted))
 
-    if len(valid_links) == 1:
+    if len(valid_links) == 1 and not inserted:
+        # Видео уже прислал кто-то другой, его комментарий автора не трогаем
+        await reply(update, context, "Это видео уже есть в таблице.")
+        await back_to_menu(update, context)
+        return ConversationHandler.END
+    elif len(valid_links) == 1:
         context.user_data["uploaded_video"] = valid_links[0]
         keyboard = [
             [InlineKeyboardButton("Оставить комментарий", callback_data="author_comment")],
             [InlineKeyboardButton("Пропустить", callback_data="skip_author_comment")]
         ]
-        await update.message.reply_text(
+        await reply(
+            update, context,
             "✅ Ссылка сохранена! Хотите оставить комментарий к вашему видео?",
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
         return WAITING_AUTHOR_COMMENT
     else:
-        await update.message.reply_text(f"✅ Сохранено ссылок: {len(valid_links)}!")
+        duplicates = len(valid_links) - len(inserted)
+        text = f"✅ Сохранено ссылок: {len(inserted)}!"
+        if duplicates:
+            text += f" Уже были в таблице: {duplicates}."
+        await reply(update, context, text)
         await back_to_menu(update, context)
         return ConversationHandler.END
 
 async def prompt_author_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    await update.callback_query.message.reply_text("Введите ваш комментарий к видео:")
+    await reply(update, context, "Введите ваш комментарий к видео:")
     return WAITING_AUTHOR_COMMENT
 
 async def skip_author_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    await update.callback_query.message.reply_text("Видео сохранено!")
+    await reply(update, context, "Видео сохранено!")
     await back_to_menu(update, context)
     return ConversationHandler.END
 
@@ -124,34 +169,39 @@ async def receive_author_comment(update: Update, context: ContextTypes.DEFAULT_T
     comment = update.message.text.strip()
     db_pool = context.bot_data.get("db_pool")
     if not db_pool:
-        await update.message.reply_text("Ошибка подключения к БД!")
+        await reply(update, context, "Ошибка подключения к БД!")
         return ConversationHandler.END
 
     video_link = context.user_data.get("uploaded_video")
     category = context.user_data.get("category")
     async with db_pool.acquire() as conn:
         await conn.execute(
-            "UPDATE videos SET author_comment = $1 WHERE link = $2 AND category = $3",
+            "UPDATE videos SET author_comment = $1 WHERE link = $2 AND category = $3 AND author_comment IS NULL",
             comment, video_link, category
         )
+    context.bot_data["categories"].mark_changed(category)
 
-    await update.message.reply_text("✅ Комментарий автора сохранён!")
+    await reply(update, context, "✅ Комментарий автора сохранён!")
     await back_to_menu(update, context)
     return ConversationHandler.END
 
 async def start_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    keyboard = [
-        [InlineKeyboardButton("qeep", callback_data="rating_cat_qeep")],
-        [InlineKeyboardButton("Harley", callback_data="rating_cat_Harley")],
-        [InlineKeyboardButton("Алтея", callback_data="video_cat_Алтея")]
-    ]
-    await update.callback_query.message.reply_text("Выберите категорию для оценки видео:", reply_markup=InlineKeyboardMarkup(keyboard))
+    registry = context.bot_data["categories"]
+    rated = await registry.rated_counts(update.effective_user.id)
+    await reply(
+        update, context,
+        f"Выберите категорию для оценки видео:\n\n{registry.summary(rated)}",
+        reply_markup=registry.keyboard("rating_cat_")
+    )
     return ConversationHandler.END
 
 async def select_rating_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    category = update.callback_query.data.split("_")[-1]
+    category = context.bot_data["categories"].parse(update.callback_query.data, "rating_cat_")
+    if not category:
+        await reply(update, context, "Эта категория больше недоступна.")
+        return ConversationHandler.END
     context.user_data["category"] = category
     return await ask_for_rating(update, context)
 
@@ -174,12 +224,12 @@ async def ask_for_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
     if not video:
-        await update.callback_query.message.reply_text("Вы оценили все видео в этой категории!")
+        await reply(update, context, "Вы оценили все видео в этой категории!")
         await back_to_menu(update, context)
         return ConversationHandler.END
 
     context.user_data["current_video"] = video["link"]
-    await update.callback_query.message.reply_text(f"Оцените видео от 1 до 10:\n{video['link']}")
+    await reply(update, context, f"Оцените видео от 1 до 10:\n{video['link']}")
     return WAITING_SCORE
 
 async def receive_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -188,36 +238,59 @@ async def receive_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not 1 <= rating <= 10:
             raise ValueError
     except ValueError:
-        await update.message.reply_text("Введите число от 1 до 10.")
+        await reply(update, context, "Введите число от 1 до 10.")
         return WAITING_SCORE
 
     db_pool = context.bot_data.get("db_pool")
     if not db_pool:
-        await update.message.reply_text("Ошибка подключения к БД!")
+        await reply(update, context, "Ошибка подключения к БД!")
         return ConversationHandler.END
 
     video_link = context.user_data.get("current_video")
     category = context.user_data.get("category")
+    user_id = update.effective_user.id
     async with db_pool.acquire() as conn:
-        await conn.execute(
+        # Отметка об оценке и сама оценка пишутся одним запросом: повторная оценка того же
+        # видео (после /cancel) и оценка видео, которое уже ушло в архив, ничего не меняют
+        scored = await conn.fetchrow(
             """
+            WITH rated AS (
+                INSERT INTO user_ratings (user_id, video_link, category)
+                SELECT $4, link, category FROM videos WHERE link = $2 AND category = $3
+                ON CONFLICT DO NOTHING
+                RETURNING video_link
+            )
             UPDATE videos
             SET total_score = total_score + $1,
                 ratings_count = ratings_count + 1,
                 avg_score = (total_score + $1)::FLOAT / (ratings_count + 1)
-            WHERE link = $2 AND category = $3
+            WHERE link = $2 AND category = $3 AND EXISTS (SELECT 1 FROM rated)
+            RETURNING avg_score, ratings_count
             """,
-            rating, video_link, category
+            rating, video_link, category, user_id
         )
+    if not scored:
+        await reply(update, context, "Это видео уже оценено или больше недоступно.")
+        return await ask_for_rating(update, context)
+
+    registry = context.bot_data["categories"]
+    registry.rating_added(user_id, category)
+    context.bot_data["leaderboard"].update(category, video_link, scored["avg_score"], scored["ratings_count"])
+    cluster = context.bot_data["cluster"]
+    await cluster.publish("rated", user_id=user_id, category=category)
+    await cluster.publish(
+        "rating", category=category, link=video_link,
+        avg_score=scored["avg_score"], ratings_count=scored["ratings_count"]
+    )
 
-    await update.message.reply_text("Оценка сохранена. Теперь оставьте комментарий:")
+    await reply(update, context, "Оценка сохранена. Теперь оставьте комментарий:")
     return WAITING_COMMENT
 
 async def receive_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     comment = update.message.text.strip()
     db_pool = context.bot_data.get("db_pool")
     if not db_pool:
-        await update.message.reply_text("Ошибка подключения к БД!")
+        await reply(update, context, "Ошибка подключения к БД!")
         return ConversationHandler.END
 
     video_link = context.user_data.get("current_video")
@@ -227,42 +300,259 @@ async def receive_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "UPDATE videos SET comments = array_append(comments, $1) WHERE link = $2 AND category = $3",
             comment, video_link, category
         )
-        await conn.execute(
-            "INSERT INTO user_ratings (user_id, video_link, category) VALUES ($1, $2, $3)",
-            update.effective_user.id, video_link, category
-        )
+    context.bot_data["categories"].mark_changed(category)
 
-    await update.message.reply_text("✅ Комментарий сохранён!")
+    await reply(update, context, "✅ Комментарий сохранён!")
     return await ask_for_rating(update, context)
 
+async def send_top(update: Update, context: ContextTypes.DEFAULT_TYPE, category: str, k: int = TOP_DEFAULT_K):
+    entries = await context.bot_data["leaderboard"].top(category, k)
+    if not entries:
+        await reply(update, context, f"В категории «{category}» пока нет видео с {TOP_MIN_RATINGS}+ оценками.")
+        return
+
+    lines = [f"🏆 Топ-{len(entries)} «{category}» (от {TOP_MIN_RATINGS} оценок):"]
+    for place, (link, avg_score, ratings_count) in enumerate(entries, start=1):
+        lines.append(f"{place}. {avg_score:.2f} ({ratings_count} оценок) — {link}")
+    await reply(update, context, "\n".join(lines), disable_web_page_preview=True)
+
+async def top_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
+    await reply(
+        update, context,
+        "Выберите категорию для просмотра лидеров:",
+        reply_markup=context.bot_data["categories"].keyboard("top_cat_")
+    )
+
+async def top_by_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
+    category = context.bot_data["categories"].parse(update.callback_query.data, "top_cat_")
+    if not category:
+        await reply(update, context, "Эта категория больше недоступна.")
+        return
+    await send_top(update, context, category)
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = list(context.args)
+    k = TOP_DEFAULT_K
+    if len(args) > 1 and args[-1].isdigit():
+        k = max(1, min(int(args.pop()), TOP_CAPACITY))
+    category = " ".join(args).strip()
+    if category not in context.bot_data["categories"].names:
+        await reply(update, context, f"Использование: /top <категория> [k], k до {TOP_CAPACITY}")
+        return
+    await send_top(update, context, category, k)
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.inline_query
+    offset = int(query.offset) if query.offset.isdigit() else 0
+    rows, next_offset = await context.bot_data["search"].search(query.query, offset)
+
+    results = []
+    for row in rows:
+        rating = f"{row['avg_score']:.1f} ({row['ratings_count']} оценок)" if row["ratings_count"] else "без оценок"
+        description = f"{row['category']} · {rating}"
+        if row["snippet"]:
+            description += f"\n{row['snippet']}"
+        results.append(InlineQueryResultArticle(
+            # id ограничен 64 байтами, а ссылка может быть длиннее
+            id=hashlib.md5(f"{row['category']}\n{row['link']}".encode()).hexdigest(),
+            title=row["link"],
+            description=description,
+            input_message_content=InputTextMessageContent(f"{row['link']}\n{description}")
+        ))
+    await query.answer(
+        results,
+        next_offset=str(next_offset) if next_offset is not None else "",
+        cache_time=SEARCH_CACHE_TTL
+    )
+
 async def help_section(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    await update.callback_query.message.reply_text(
+    await reply(
+        update, context,
         "ℹ️ Помощь:\n\n"
         "🎥 Отправка видео — загрузка одного или нескольких видео в систему.\n"
         "⭐ Оценка видео — проставление оценки и комментария другим участникам.\n"
+        "🏆 Лидеры — лучшие видео категории, также /top <категория> [k].\n"
         "📥 Выгрузка — скачать таблицу по каждой категории.\n"
-        "🧹 Очистка — очистка базы (только для админов)."
+        "🔎 Поиск — наберите @имя_бота и текст в любом чате, ищет по ссылкам и комментариям.\n"
+        "🧹 Очистка — перенос сессии категории в архив (только для админов)."
+    )
+
+async def clear_table(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
+    if update.effective_user.id not in ADMIN_IDS:
+        await reply(update, context, "⛔ Нет доступа")
+        return
+    registry = context.bot_data["categories"]
+    await reply(
+        update, context,
+        "Выберите категорию, сессию которой нужно завершить и перенести в архив:\n\n"
+        f"{registry.summary()}",
+        reply_markup=registry.keyboard("clear_cat_")
+    )
+
+async def clear_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
+    if update.effective_user.id not in ADMIN_IDS:
+        await reply(update, context, "⛔ Нет доступа")
+        return
+    category = context.bot_data["categories"].parse(update.callback_query.data, "clear_cat_")
+    if not category:
+        await reply(update, context, "Эта категория больше недоступна.")
+        return
+    markup = InlineKeyboardMarkup([
+        [InlineKeyboardButton("✅ Да, в архив", callback_data=f"clear_ok_{category}")],
+        [InlineKeyboardButton("⬅️ Назад", callback_data='back_to_start')]
+    ])
+    await reply(
+        update, context,
+        f"Перенести все видео и оценки категории «{category}» в архив? "
+        "Живая таблица категории станет пустой, выгрузка сессии останется доступна через /sessions.",
+        reply_markup=markup
+    )
+
+async def clear_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer()
+    if update.effective_user.id not in ADMIN_IDS:
+        await reply(update, context, "⛔ Нет доступа")
+        return
+    registry = context.bot_data["categories"]
+    category = registry.parse(update.callback_query.data, "clear_ok_")
+    if not category:
+        await reply(update, context, "Эта категория больше недоступна.")
+        return
+
+    session_id, videos_count = await archive_category(
+        context.bot_data["db_pool"], category, update.effective_user.id
+    )
+    registry.category_cleared(category)
+    context.bot_data["leaderboard"].reset(category)
+    await context.bot_data["cluster"].publish("cleared", category=category)
+
+    await reply(
+        update, context,
+        f"✅ Сессия #{session_id} «{category}» в архиве, видео: {videos_count}. "
+        f"Выгрузка: /export_session {session_id}"
     )
+    await back_to_menu(update, context)
+
+async def sessions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        await reply(update, context, "⛔ Нет доступа")
+        return
+    sessions = await list_sessions(context.bot_data["db_pool"])
+    if not sessions:
+        await reply(update, context, "Архив пуст.")
+        return
+    lines = ["Архивные сессии:"]
+    for session in sessions:
+        lines.append(
+            f"#{session['id']} «{session['category']}» {session['archived_at']:%Y-%m-%d %H:%M}, "
+            f"видео: {session['videos_count']}"
+        )
+    lines.append("\nВыгрузка: /export_session <id>")
+    await reply(update, context, "\n".join(lines))
+
+async def export_session_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        await reply(update, context, "⛔ Нет доступа")
+        return
+    if not context.args or not context.args[0].isdigit():
+        await reply(update, context, "Использование: /export_session <id>")
+        return
+
+    session_id = int(context.args[0])
+    export = await session_export(context.bot_data["db_pool"], session_id)
+    if export is None:
+        await reply(update, context, "Сессия не найдена.")
+        return
+    category, content = export
+    await reply_document(update, context, InputFile(content, filename=f"{category}_session_{session_id}.csv"))
 
 async def add_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id not in ADMIN_IDS:
-        await update.message.reply_text("⛔ Нет доступа")
+        await reply(update, context, "⛔ Нет доступа")
         return
 
     if not context.args:
-        await update.message.reply_text("Укажите ID пользователя: /add_admin <id>")
+        await reply(update, context, "Укажите ID пользователя: /add_admin <id>")
         return
 
     try:
         new_id = int(context.args[0])
-        if new_id not in ADMIN_IDS:
-            ADMIN_IDS.append(new_id)
-            await update.message.reply_text(f"✅ Админ добавлен: {new_id}")
-        else:
-            await update.message.reply_text("Этот ID уже админ.")
     except ValueError:
-        await update.message.reply_text("ID должен быть числом.")
+        await reply(update, context, "ID должен быть числом.")
+        return
+
+    if await grant_admin(context.bot_data["db_pool"], new_id, update.effective_user.id):
+        await context.bot_data["cluster"].publish("admins", user_id=new_id)
+        await reply(update, context, f"✅ Админ добавлен: {new_id}")
+    else:
+        await reply(update, context, "Этот ID уже админ.")
+
+async def add_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        await reply(update, context, "⛔ Нет доступа")
+        return
+
+    name = " ".join(context.args).strip()
+    registry = context.bot_data["categories"]
+    error = registry.validate_name(name)
+    if error:
+        await reply(update, context, f"{error}\nИспользование: /add_category <название>")
+        return
+
+    if await registry.add(name):
+        await context.bot_data["cluster"].publish("categories")
+        await reply(update, context, f"✅ Категория добавлена: {name}")
+    else:
+        await reply(update, context, "Такая категория уже есть.")
+
+async def retire_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        await reply(update, context, "⛔ Нет доступа")
+        return
+
+    name = " ".join(context.args).strip()
+    if not name:
+        await reply(update, context, "Использование: /retire_category <название>")
+        return
+
+    if await context.bot_data["categories"].retire(name):
+        await context.bot_data["cluster"].publish("categories")
+        await reply(update, context, f"✅ Категория убрана из меню: {name}")
+    else:
+        await reply(update, context, "Активной категории с таким названием нет.")
+
+async def list_categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    registry = context.bot_data["categories"]
+    if not registry.names:
+        await reply(update, context, "Категорий пока нет.")
+        return
+    await reply(update, context, f"Категории:\n{registry.summary()}")
+
+async def jobs_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS:
+        await reply(update, context, "⛔ Нет доступа")
+        return
+
+    stats = context.bot_data.get("job_stats", {})
+    async with context.bot_data["db_pool"].acquire() as conn:
+        runs = await conn.fetch("SELECT name, last_started_at, duration_ms FROM job_runs ORDER BY name")
+
+    cluster = context.bot_data["cluster"]
+    role = "лидер" if cluster.is_leader else "не лидер"
+    lines = [f"Реплика {cluster.replica_id} ({role}), фоновые задачи:"]
+    for name, stat in sorted(stats.items()):
+        lines.append(f"- {name}: {stat['status']}, {stat['duration'] * 1000:.0f} мс")
+    if not stats:
+        lines.append("- ещё не запускались")
+    lines.append("\nОбщие задачи (последний запуск в любой реплике):")
+    for run in runs:
+        lines.append(f"- {run['name']}: {run['last_started_at']:%Y-%m-%d %H:%M:%S}, {run['duration_ms']} мс")
+    await reply(update, context, "\n".join(lines))
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     import traceback
@@ -271,107 +561,175 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
 # Новые функции для скачивания таблиц
 async def download(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    keyboard = [
-        [InlineKeyboardButton("qeep", callback_data="download_qeep")],
-        [InlineKeyboardButton("Harley", callback_data="download_Harley")],
-        [InlineKeyboardButton("Алтея", callback_data="download_Алтея")]
-    ]
-    await update.callback_query.message.reply_text(
-        "Выберите категорию для скачивания таблицы:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+    registry = context.bot_data["categories"]
+    await reply(
+        update, context,
+        f"Выберите категорию для скачивания таблицы:\n\n{registry.summary()}",
+        reply_markup=registry.keyboard("download_")
     )
 
 async def download_by_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
-    category = update.callback_query.data.split("_")[1]  # Извлекаем категорию из callback_data
+    category = context.bot_data["categories"].parse(update.callback_query.data, "download_")
+    if not category:
+        await reply(update, context, "Эта категория больше недоступна.")
+        return
     db_pool = context.bot_data.get("db_pool")  # Получаем пул соединений с БД
     if not db_pool:
-        await update.callback_query.message.reply_text("Ошибка подключения к БД!")
+        await reply(update, context, "Ошибка подключения к БД!")
         return
 
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT link, avg_score, ratings_count, comments FROM videos WHERE category = $1",
-            category
-        )
+    # Обычно выгрузка уже отрендерена фоновой задачей render_exports
+    pending = category in context.bot_data["categories"].changed
+    content = await get_export(db_pool, category, pending=pending)
 
-    if not rows:
-        await update.callback_query.message.reply_text("Нет данных для этой категории.")
+    if not content:
+        await reply(update, context, "Нет данных для этой категории.")
         return
 
-    df = pd.DataFrame(rows, columns=["Ссылка", "Средняя оценка", "Количество оценок", "Комментарии"])
-    with NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
-        df.to_csv(tmp.name, index=False)
-        tmp_path = tmp.name
+    await reply_document(update, context, InputFile(content, filename=f"{category}_videos.csv"))
 
-    await context.bot.send_document(
-        chat_id=update.effective_chat.id,
-        document=InputFile(tmp_path, filename=f"{category}_videos.csv")
+async def cancel_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply(update, context, "Действие отменено.")
+    await back_to_menu(update, context)
+    return ConversationHandler.END
+
+async def leave_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # На кнопку отвечает её собственный хендлер в группе 0, здесь только выходим из диалога
+    return ConversationHandler.END
+
+# Загрузка видео и оценка идут по шагам, поэтому текстовые хендлеры живут в диалоге
+creative_session_conversation = ConversationHandler(
+    entry_points=[
+        CallbackQueryHandler(select_video_category, pattern="^video_cat_"),
+        CallbackQueryHandler(select_rating_category, pattern="^rating_cat_")
+    ],
+    states={
+        WAITING_VIDEO_LINKS: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_video_links)],
+        WAITING_AUTHOR_COMMENT: [
+            CallbackQueryHandler(prompt_author_comment, pattern="^author_comment$"),
+            CallbackQueryHandler(skip_author_comment, pattern="^skip_author_comment$"),
+            MessageHandler(filters.TEXT & ~filters.COMMAND, receive_author_comment)
+        ],
+        WAITING_SCORE: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_rating)],
+        WAITING_COMMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_comment)]
+    },
+    fallbacks=[
+        CommandHandler("cancel", cancel_session),
+        CallbackQueryHandler(leave_session, pattern=MENU_CALLBACKS)
+    ],
+    allow_reentry=True,
+    conversation_timeout=SESSION_TIMEOUT
+)
+
+async def on_startup(app):
+    app.bot_data["db_pool"] = await init_db_pool()
+    app.bot_data["outbox"] = Outbox(
+        app.bot, global_rate=GLOBAL_RATE / REPLICAS, global_burst=max(1, GLOBAL_BURST // REPLICAS)
     )
-    os.remove(tmp_path)  # Удаляем временный файл после отправки
-from telegram.ext import ApplicationBuilder
 
-import asyncio
+    async with app.bot_data["db_pool"].acquire() as conn:
+        await init_schema(conn)
+    await load_admins(app.bot_data["db_pool"])
+
+    app.bot_data["categories"] = CategoryRegistry(app.bot_data["db_pool"])
+    await app.bot_data["categories"].load()
+
+    app.bot_data["leaderboard"] = Leaderboard(app.bot_data["db_pool"])
+    app.bot_data["search"] = VideoSearch(app.bot_data["db_pool"])
+    for category in app.bot_data["categories"].names:
+        await app.bot_data["leaderboard"].load(category)
+
+    # Изменения из других реплик приходят через LISTEN/NOTIFY
+    cluster = Cluster(DATABASE_URL, app.bot_data["db_pool"])
+    app.bot_data["cluster"] = cluster
+    subscribe_admins(cluster, app.bot_data["db_pool"])
+    app.bot_data["categories"].subscribe(cluster)
+    app.bot_data["leaderboard"].subscribe(cluster)
+    subscribe_ai(cluster)
+    await cluster.start()
+
+    print(f"Бот запущен, реплика {cluster.replica_id}" + (" (лидер)" if cluster.is_leader else ""))
+
+async def on_stop(app):
+    # Пакеты AI останавливаем первыми, чтобы их сообщения тоже ушли; недоделанное продолжит resume_batches
+    await cancel_batches(app.bot_data)
+    # Апдейты уже обработаны, дожидаемся отправки ответов, пока бот ещё инициализирован
+    await app.bot_data["outbox"].close()
+
+async def on_shutdown(app):
+    await close_http_session(app.bot_data)
+    await app.bot_data["cluster"].close()
+    await app.bot_data["db_pool"].close()
+    print("Бот остановлен")
+
+def install_uvloop() -> bool:
+    """Ставит uvloop как политику event loop, если он установлен"""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+def build_application():
+    app = (
+        ApplicationBuilder()
+        .token(os.getenv("TOKEN"))
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+
+    app.add_handler(creative_session_handler)
+    app.add_handler(creative_session_conversation, group=SESSION_GROUP)
+    app.add_handler(CallbackQueryHandler(send_video_prompt, pattern="^send_video_prompt$"))
+    app.add_handler(CallbackQueryHandler(start_review, pattern="^start_review$"))
+    app.add_handler(CallbackQueryHandler(top_menu, pattern="^top$"))
+    app.add_handler(CallbackQueryHandler(top_by_category, pattern="^top_cat_"))
+    app.add_handler(CommandHandler("top", top_command))
+    app.add_handler(InlineQueryHandler(inline_search))
+    app.add_handler(CallbackQueryHandler(download, pattern="^download$"))
+    app.add_handler(CallbackQueryHandler(download_by_category, pattern="^download_"))
+    app.add_handler(CallbackQueryHandler(help_section, pattern="^help$"))
+    app.add_handler(CallbackQueryHandler(clear_table, pattern="^clear_table$"))
+    app.add_handler(CallbackQueryHandler(clear_category, pattern="^clear_cat_"))
+    app.add_handler(CallbackQueryHandler(clear_confirm, pattern="^clear_ok_"))
+    app.add_handler(CommandHandler("sessions", sessions_command))
+    app.add_handler(CommandHandler("export_session", export_session_command))
+    app.add_handler(CommandHandler("add_admin", add_admin))
+    app.add_handler(CommandHandler("add_category", add_category))
+    app.add_handler(CommandHandler("retire_category", retire_category))
+    app.add_handler(CommandHandler("categories", list_categories))
+    app.add_handler(CommandHandler("jobs", jobs_status))
+    app.add_error_handler(error_handler)
+
+    add_ai_handlers(app)
+    schedule_jobs(app)
+    return app
 
 def main():
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
-        import nest_asyncio
-        nest_asyncio.apply()
-
-    async def setup():
-        app = ApplicationBuilder().token(os.getenv("TOKEN")).build()
-        app.bot_data["db_pool"] = await init_db_pool()
-
-        async with app.bot_data["db_pool"].acquire() as conn:
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS videos (
-                    link TEXT NOT NULL,
-                    category TEXT NOT NULL,
-                    author_comment TEXT,
-                    total_score INTEGER DEFAULT 0,
-                    ratings_count INTEGER DEFAULT 0,
-                    avg_score FLOAT DEFAULT 0,
-                    comments TEXT[] DEFAULT '{}',
-                    PRIMARY KEY (link, category)
-                );
-                CREATE TABLE IF NOT EXISTS user_ratings (
-                    user_id BIGINT NOT NULL,
-                    video_link TEXT NOT NULL,
-                    category TEXT NOT NULL,
-                    PRIMARY KEY (user_id, video_link, category)
-                );
-                CREATE TABLE IF NOT EXISTS model_settings (
-                    model_name TEXT PRIMARY KEY,
-                    is_active BOOLEAN DEFAULT FALSE
-                );
-            """)
-
-        app.add_handler(creative_session_handler)
-        app.add_handler(CallbackQueryHandler(select_video_category, pattern="^video_cat_"))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, receive_video_links))
-        app.add_handler(CallbackQueryHandler(prompt_author_comment, pattern="^author_comment$"))
-        app.add_handler(CallbackQueryHandler(skip_author_comment, pattern="^skip_author_comment$"))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, receive_author_comment))
-        app.add_handler(CallbackQueryHandler(start_review, pattern="^start_review$"))
-        app.add_handler(CallbackQueryHandler(select_rating_category, pattern="^rating_cat_"))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, receive_rating))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, receive_comment))
-        app.add_handler(CallbackQueryHandler(download, pattern="^download$"))
-        app.add_handler(CallbackQueryHandler(download_by_category, pattern="^download_"))
-        app.add_handler(CallbackQueryHandler(help_section, pattern="^help$"))
-        app.add_handler(CommandHandler("add_admin", add_admin))
-        app.add_error_handler(error_handler)
-
-        print("До add_ai_handlers")
-        add_ai_handlers(app)
-        print("После add_ai_handlers")
-
-        print("Бот запущен...")
-        return app
-
-    app = loop.run_until_complete(setup())
-    app.run_polling()
+    if REPLICAS > 1 and not WEBHOOK_URL:
+        # getUpdates отдаёт апдейты только одному получателю, остальные реплики получат 409 Conflict
+        raise SystemExit("Для нескольких реплик нужен WEBHOOK_URL")
+    if install_uvloop():
+        print("Используется uvloop")
+    app = build_application()
+    # run_polling и run_webhook сами управляют циклом: по SIGINT/SIGTERM дообрабатывают
+    # полученные апдейты, затем вызывают post_stop и post_shutdown
+    if WEBHOOK_URL:
+        # Каждая реплика ставит один и тот же вебхук, повторный setWebhook ничего не меняет
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=urlsplit(WEBHOOK_URL).path.lstrip("/"),
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            bootstrap_retries=5
+        )
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,178 @@
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+import asyncpg
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from schema import ensure_partitions
+
+logger = logging.getLogger(__name__)
+
+# Префиксы callback_data для меню, где нужен выбор категории
+MENU_PREFIXES = ("video_cat_", "rating_cat_", "download_", "top_cat_", "clear_cat_", "clear_ok_")
+
+# Telegram ограничивает callback_data 64 байтами
+MAX_CALLBACK_DATA_BYTES = 64
+MAX_NAME_BYTES = MAX_CALLBACK_DATA_BYTES - max(len(p.encode()) for p in MENU_PREFIXES)
+
+# Сколько пользователей держим в кэше счётчиков оценок
+RATED_CACHE_SIZE = 10000
+
+
+class CategoryRegistry:
+    """Реестр категорий с заранее собранными клавиатурами и кэшем счётчиков.
+
+    Клавиатуры пересобираются только при изменении списка категорий, а
+    количество видео и оценок пользователя обновляется по месту из хендлеров,
+    поэтому нажатие на кнопку меню не ходит в базу.
+    """
+
+    def __init__(self, db_pool: asyncpg.Pool):
+        self.db_pool = db_pool
+        self.names: List[str] = []
+        self.video_counts: Dict[str, int] = {}
+        self._keyboards: Dict[str, InlineKeyboardMarkup] = {}
+        self._rated: "OrderedDict[int, Dict[str, int]]" = OrderedDict()
+        # Категории с изменениями, ещё не записанными в categories.updated_at
+        self.changed: Set[str] = set()
+
+    async def load(self):
+        """Загружает активные категории и количество видео в них"""
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("SELECT name FROM categories WHERE is_active ORDER BY id")
+            counts = await conn.fetch("SELECT category, count(*) AS n FROM videos GROUP BY category")
+        self.names = [row["name"] for row in rows]
+        self.video_counts = {row["category"]: row["n"] for row in counts}
+        self._keyboards.clear()
+
+    def keyboard(self, prefix: str) -> InlineKeyboardMarkup:
+        """Клавиатура выбора категории для меню с данным префиксом callback_data"""
+        markup = self._keyboards.get(prefix)
+        if markup is None:
+            markup = InlineKeyboardMarkup([
+                [InlineKeyboardButton(name, callback_data=f"{prefix}{name}")]
+                for name in self.names
+            ])
+            self._keyboards[prefix] = markup
+        return markup
+
+    def parse(self, data: str, prefix: str) -> Optional[str]:
+        """Достаёт категорию из callback_data, если она всё ещё активна"""
+        name = data[len(prefix):]
+        return name if name in self.names else None
+
+    @staticmethod
+    def validate_name(name: str) -> Optional[str]:
+        """Возвращает текст ошибки или None, если имя подходит"""
+        if not name:
+            return "Название категории не может быть пустым."
+        if len(name.encode()) > MAX_NAME_BYTES:
+            return f"Название слишком длинное (максимум {MAX_NAME_BYTES} байт)."
+        return None
+
+    async def add(self, name: str) -> bool:
+        """Добавляет категорию или возвращает ранее выведенную. False, если она уже активна"""
+        if name in self.names:
+            return False
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    INSERT INTO categories (name) VALUES ($1)
+                    ON CONFLICT (name) DO UPDATE SET is_active = TRUE
+                    """,
+                    name
+                )
+                await ensure_partitions(conn, name)
+        await self.load()
+        return True
+
+    async def retire(self, name: str) -> bool:
+        """Убирает категорию из меню. Данные категории остаются в базе"""
+        if name not in self.names:
+            return False
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("UPDATE categories SET is_active = FALSE WHERE name = $1", name)
+        await self.load()
+        return True
+
+    def mark_changed(self, category: str):
+        self.changed.add(category)
+
+    def take_changed(self) -> Set[str]:
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def videos_added(self, category: str, count: int):
+        self._count_videos(category, count)
+        if count:
+            self.mark_changed(category)
+
+    def category_cleared(self, category: str):
+        """Живые данные категории ушли в архив"""
+        self._clear_counts(category)
+        self.mark_changed(category)
+
+    def rating_added(self, user_id: int, category: str):
+        self._count_rating(user_id, category)
+        self.mark_changed(category)
+
+    def _count_videos(self, category: str, count: int):
+        self.video_counts[category] = self.video_counts.get(category, 0) + count
+
+    def _clear_counts(self, category: str):
+        self.video_counts[category] = 0
+        for rated in self._rated.values():
+            rated.pop(category, None)
+
+    def _count_rating(self, user_id: int, category: str):
+        rated = self._rated.get(user_id)
+        if rated is not None:
+            rated[category] = rated.get(category, 0) + 1
+
+    def _resync(self):
+        self._rated.clear()
+        return self.load()
+
+    def subscribe(self, cluster):
+        """Применяет изменения из других реплик.
+
+        Отметку для flush_changes ставит реплика, где изменение произошло,
+        поэтому здесь обновляются только счётчики.
+        """
+        cluster.on("categories", lambda event: self.load())
+        cluster.on("videos", lambda event: self._count_videos(event["category"], event["count"]))
+        cluster.on("cleared", lambda event: self._clear_counts(event["category"]))
+        cluster.on("rated", lambda event: self._count_rating(event["user_id"], event["category"]))
+        cluster.on("resync", lambda event: self._resync())
+
+    async def rated_counts(self, user_id: int) -> Dict[str, int]:
+        """Сколько видео пользователь оценил в каждой категории"""
+        rated = self._rated.get(user_id)
+        if rated is not None:
+            self._rated.move_to_end(user_id)
+            return rated
+
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT category, count(*) AS n FROM user_ratings WHERE user_id = $1 GROUP BY category",
+                user_id
+            )
+        rated = {row["category"]: row["n"] for row in rows}
+        self._rated[user_id] = rated
+        if len(self._rated) > RATED_CACHE_SIZE:
+            self._rated.popitem(last=False)
+        return rated
+
+    def summary(self, rated: Optional[Dict[str, int]] = None) -> str:
+        """Строки со счётчиками по категориям для текста меню"""
+        lines = []
+        for name in self.names:
+            total = self.video_counts.get(name, 0)
+            if rated is None:
+                lines.append(f"{name}: видео {total}")
+            else:
+                unrated = max(total - rated.get(name, 0), 0)
+                lines.append(f"{name}: видео {total}, не оценено вами {unrated}")
+        return "\n".join(lines)
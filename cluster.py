@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Канал, через который реплики сообщают друг другу об изменениях общего состояния
+EVENTS_CHANNEL = "bot_events"
+# Реплика, которая держит эту блокировку, — лидер и выполняет общие фоновые задачи
+LEADER_LOCK = "bot_leader"
+# Как часто проверяем соединение и пытаемся стать лидером, в секундах
+WATCH_INTERVAL = 10
+
+# Postgres не пропускает NOTIFY с payload длиннее 8000 байт
+MAX_PAYLOAD_BYTES = 8000
+
+
+class Cluster:
+    """Связь реплики с остальными через Postgres.
+
+    Отдельное от пула соединение слушает канал bot_events и держит advisory lock
+    лидера, поэтому блокировка снимается сама, как только реплика пропадает.
+    После обрыва соединения пропущенные уведомления уже не вернуть, так что
+    обработчики получают событие resync и перечитывают состояние из базы.
+    """
+
+    def __init__(self, dsn: str, db_pool: asyncpg.Pool):
+        self.dsn = dsn
+        self.db_pool = db_pool
+        self.replica_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self._conn: Optional[asyncpg.Connection] = None
+        self._handlers: Dict[str, List[Callable[[dict], object]]] = {}
+
+    def on(self, event: str, handler: Callable[[dict], object]):
+        """Подписывает обработчик на событие других реплик. Он может вернуть корутину"""
+        self._handlers.setdefault(event, []).append(handler)
+
+    async def start(self):
+        await self._connect()
+        await self._elect()
+
+    async def close(self):
+        # Вместе с сессией снимается и блокировка лидера
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self.is_leader = False
+
+    async def publish(self, event: str, **payload):
+        """Рассылает событие остальным репликам. Своё событие реплика не обрабатывает"""
+        message = json.dumps({"event": event, "origin": self.replica_id, **payload}, ensure_ascii=False)
+        if len(message.encode()) > MAX_PAYLOAD_BYTES:
+            # Такое уведомление не дойдёт, поэтому просим всех перечитать состояние из базы
+            logger.warning(f"Событие {event} слишком большое, отправляем resync")
+            message = json.dumps({"event": "resync", "origin": self.replica_id})
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("SELECT pg_notify($1, $2)", EVENTS_CHANNEL, message)
+
+    async def watch(self):
+        """Проверяет соединение, восстанавливает его после обрыва и пытается стать лидером"""
+        if self._conn is not None and not self._conn.is_closed():
+            try:
+                await self._elect()
+                return
+            except (OSError, asyncpg.InterfaceError, asyncpg.PostgresError) as e:
+                logger.warning(f"Соединение кластера потеряно: {str(e)}")
+                self._conn.terminate()
+
+        if self.is_leader:
+            logger.warning("Реплика больше не лидер")
+        await self._connect()
+        self._dispatch("resync", {})
+        await self._elect()
+
+    async def _connect(self):
+        self.is_leader = False
+        self._conn = await asyncpg.connect(self.dsn)
+        await self._conn.add_listener(EVENTS_CHANNEL, self._on_notify)
+
+    async def _elect(self):
+        if self.is_leader:
+            # Запрос заодно проверяет, что соединение с блокировкой живо
+            await self._conn.fetchval("SELECT 1")
+            return
+        self.is_leader = await self._conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", LEADER_LOCK)
+        if self.is_leader:
+            logger.info(f"Реплика {self.replica_id} стала лидером")
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Некорректное событие кластера: {payload[:200]}")
+            return
+        if message.pop("origin", None) == self.replica_id:
+            return
+        self._dispatch(message.pop("event", ""), message)
+
+    def _dispatch(self, event: str, message: dict):
+        # Синхронные обработчики вызываются сразу, поэтому события применяются в порядке прихода
+        for handler in self._handlers.get(event, []):
+            try:
+                result = handler(message)
+            except Exception as e:
+                logger.error(f"Ошибка обработки события {event}: {str(e)}", exc_info=True)
+                continue
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(self._finish(event, result))
+
+    @staticmethod
+    async def _finish(event: str, coro):
+        try:
+            await coro
+        except Exception as e:
+            logger.error(f"Ошибка обработки события {event}: {str(e)}", exc_info=True)
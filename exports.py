@@ -0,0 +1,55 @@
+import asyncio
+
+import asyncpg
+
+EXPORT_COLUMNS = ["Ссылка", "Средняя оценка", "Количество оценок", "Комментарии"]
+
+
+def render_videos_csv(rows) -> bytes:
+    # pandas нужен только для выгрузок, поэтому не тянем его при старте бота
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+    return df.to_csv(index=False).encode("utf-8")
+
+
+async def render_export(conn: asyncpg.Connection, category: str) -> bytes:
+    """Рендерит выгрузку категории и сохраняет её в exports. Пустая категория — b''"""
+    # Время берём до выборки: всё, что изменится после него, сделает выгрузку устаревшей
+    snapshot_at = await conn.fetchval("SELECT now()")
+    rows = await conn.fetch(
+        "SELECT link, avg_score, ratings_count, comments FROM videos WHERE category = $1",
+        category
+    )
+    # DataFrame и to_csv — синхронная работа, в потоке она не держит цикл событий и хендлеры
+    content = await asyncio.to_thread(render_videos_csv, rows) if rows else b""
+    await conn.execute(
+        """
+        INSERT INTO exports (category, content, rendered_at) VALUES ($1, $2, $3)
+        ON CONFLICT (category) DO UPDATE SET content = EXCLUDED.content, rendered_at = EXCLUDED.rendered_at
+        -- Рендер идёт вне транзакции, поэтому более старый снимок не должен затереть более новый
+        WHERE exports.rendered_at <= EXCLUDED.rendered_at
+        """,
+        category, content, snapshot_at
+    )
+    return content
+
+
+async def get_export(db_pool: asyncpg.Pool, category: str, pending: bool = False) -> bytes:
+    """Отдаёт заранее отрендеренную выгрузку, если она свежая, иначе рендерит на месте.
+
+    pending — в категории есть изменения, ещё не записанные в categories.updated_at.
+    """
+    async with db_pool.acquire() as conn:
+        if not pending:
+            content = await conn.fetchval(
+                """
+                SELECT e.content FROM exports e
+                JOIN categories c ON c.name = e.category
+                WHERE e.category = $1 AND e.rendered_at >= c.updated_at
+                """,
+                category
+            )
+            if content is not None:
+                return content
+        return await render_export(conn, category)
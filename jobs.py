@@ -0,0 +1,168 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+from telegram.ext import ContextTypes
+
+from ai_assistant import expire_caches as expire_ai_caches, resume_batches
+from cluster import WATCH_INTERVAL
+from exports import render_export
+from schema import PARTITIONED_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Интервалы запуска фоновых задач, в секундах
+FLUSH_CHANGES_INTERVAL = 15
+EXPORTS_INTERVAL = 300
+VACUUM_INTERVAL = 3600
+CACHE_INTERVAL = 60
+AI_BATCH_RESUME_INTERVAL = 60
+
+# VACUUM запускаем, только когда мёртвых строк накопилось достаточно (их оставляют обновления оценок).
+# Секции очищаются TRUNCATE, поэтому после архивации мёртвых строк нет
+VACUUM_DEAD_TUPLES = 10000
+
+
+@asynccontextmanager
+async def singleton(db_pool: asyncpg.Pool, name: str):
+    """Advisory lock на время задачи: с несколькими репликами её выполнит только одна.
+
+    Отдаёт соединение, которое держит блокировку, или None, если её взял кто-то другой.
+    """
+    async with db_pool.acquire() as conn:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", name):
+            yield None
+            return
+        try:
+            yield conn
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", name)
+
+
+async def flush_changes(context: ContextTypes.DEFAULT_TYPE):
+    """Переносит изменённые в этой реплике категории в categories.updated_at"""
+    registry = context.bot_data["categories"]
+    changed = registry.take_changed()
+    if not changed:
+        return
+    try:
+        async with context.bot_data["db_pool"].acquire() as conn:
+            await conn.execute("UPDATE categories SET updated_at = now() WHERE name = ANY($1)", list(changed))
+    except Exception:
+        registry.changed.update(changed)
+        raise
+
+
+async def render_exports(conn: asyncpg.Connection, last_started_at):
+    """Заранее рендерит выгрузки категорий, изменившихся после прошлого рендера"""
+    stale = await conn.fetch(
+        """
+        SELECT c.name FROM categories c
+        LEFT JOIN exports e ON e.category = c.name
+        WHERE c.is_active AND (e.rendered_at IS NULL OR e.rendered_at < c.updated_at)
+        """
+    )
+    for row in stale:
+        await render_export(conn, row["name"])
+
+
+async def vacuum_tables(conn: asyncpg.Connection, last_started_at):
+    """VACUUM секций, в которых накопились мёртвые строки.
+
+    Статистика мёртвых строк есть только у секций, у секционированной таблицы её нет.
+    """
+    rows = await conn.fetch(
+        """
+        SELECT s.relid::regclass::text AS name
+        FROM pg_stat_user_tables s
+        JOIN pg_inherits i ON i.inhrelid = s.relid
+        WHERE i.inhparent = ANY(SELECT to_regclass(t) FROM unnest($1::text[]) AS t)
+          AND s.n_dead_tup >= $2
+        """,
+        list(PARTITIONED_TABLES), VACUUM_DEAD_TUPLES
+    )
+    for row in rows:
+        # regclass::text уже экранирует имя секции, поэтому подставлять его в SQL безопасно
+        await conn.execute(f"VACUUM (ANALYZE) {row['name']}")
+
+
+async def expire_caches(context: ContextTypes.DEFAULT_TYPE):
+    expire_ai_caches()
+    context.bot_data["search"].expire()
+
+
+async def watch_cluster(context: ContextTypes.DEFAULT_TYPE):
+    await context.bot_data["cluster"].watch()
+
+
+def _record(context: ContextTypes.DEFAULT_TYPE, name: str, duration: float, status: str):
+    context.bot_data.setdefault("job_stats", {})[name] = {
+        "duration": duration,
+        "status": status,
+        "finished_at": time.time()
+    }
+    logger.info(f"Задача {name}: {status} за {duration:.3f} с")
+
+
+def local_job(name: str, func):
+    """Задача, которая работает с состоянием своей реплики"""
+    async def callback(context: ContextTypes.DEFAULT_TYPE):
+        started = time.monotonic()
+        try:
+            await func(context)
+        except Exception as e:
+            logger.error(f"Ошибка задачи {name}: {str(e)}", exc_info=True)
+            _record(context, name, time.monotonic() - started, "ошибка")
+        else:
+            _record(context, name, time.monotonic() - started, "ok")
+    return callback
+
+
+def singleton_job(name: str, func):
+    """Задача над общей базой: только в реплике-лидере, под advisory lock, с учётом запусков в job_runs"""
+    async def callback(context: ContextTypes.DEFAULT_TYPE):
+        # Блокировка задачи остаётся на случай, если лидер сменился прямо во время запуска
+        if not context.bot_data["cluster"].is_leader:
+            return
+        started = time.monotonic()
+        async with singleton(context.bot_data["db_pool"], f"job:{name}") as conn:
+            if conn is None:
+                return
+            try:
+                last_started_at = await conn.fetchval(
+                    "SELECT last_started_at FROM job_runs WHERE name = $1", name
+                )
+                run_started_at = await conn.fetchval("SELECT now()")
+                await func(conn, last_started_at)
+                duration = time.monotonic() - started
+                await conn.execute(
+                    """
+                    INSERT INTO job_runs (name, last_started_at, duration_ms) VALUES ($1, $2, $3)
+                    ON CONFLICT (name) DO UPDATE
+                    SET last_started_at = EXCLUDED.last_started_at, duration_ms = EXCLUDED.duration_ms
+                    """,
+                    name, run_started_at, int(duration * 1000)
+                )
+            except Exception as e:
+                logger.error(f"Ошибка задачи {name}: {str(e)}", exc_info=True)
+                _record(context, name, time.monotonic() - started, "ошибка")
+            else:
+                _record(context, name, duration, "ok")
+    return callback
+
+
+def schedule_jobs(app):
+    job_queue = app.job_queue
+    if job_queue is None:
+        logger.warning("JobQueue недоступен (нужен python-telegram-bot[job-queue]), фоновые задачи отключены")
+        return
+
+    job_queue.run_repeating(local_job("flush_changes", flush_changes), FLUSH_CHANGES_INTERVAL, name="flush_changes")
+    job_queue.run_repeating(local_job("expire_caches", expire_caches), CACHE_INTERVAL, name="expire_caches")
+    job_queue.run_repeating(local_job("watch_cluster", watch_cluster), WATCH_INTERVAL, name="watch_cluster")
+    job_queue.run_repeating(local_job("resume_batches", resume_batches), AI_BATCH_RESUME_INTERVAL, first=10,
+                            name="resume_batches")
+    job_queue.run_repeating(singleton_job("render_exports", render_exports), EXPORTS_INTERVAL, first=30,
+                            name="render_exports")
+    job_queue.run_repeating(singleton_job("vacuum_tables", vacuum_tables), VACUUM_INTERVAL, name="vacuum_tables")
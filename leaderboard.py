@@ -0,0 +1,102 @@
+import bisect
+import os
+from typing import Dict, List, Tuple
+
+import asyncpg
+
+# Видео попадает в топ только после стольких оценок
+TOP_MIN_RATINGS = int(os.getenv("TOP_MIN_RATINGS", "3"))
+# Сколько лучших видео держим в памяти на категорию
+TOP_CAPACITY = 50
+TOP_DEFAULT_K = 10
+
+# Ключ сортировки: выше средняя оценка, при равенстве больше оценок, затем по ссылке
+Key = Tuple[float, int, str]
+
+
+def _key(link: str, avg_score: float, ratings_count: int) -> Key:
+    return (-avg_score, -ratings_count, link)
+
+
+class _CategoryTop:
+    """Лучшие видео одной категории, отсортированные по ключу.
+
+    Инвариант: любое подходящее видео вне списка не лучше худшего в списке.
+    truncated означает, что такие видео вообще могут быть.
+    """
+
+    def __init__(self, rows, truncated: bool):
+        self.keys: List[Key] = sorted(_key(r["link"], r["avg_score"], r["ratings_count"]) for r in rows)
+        self.by_link: Dict[str, Key] = {key[2]: key for key in self.keys}
+        self.truncated = truncated
+
+    def _insert(self, key: Key):
+        bisect.insort(self.keys, key)
+        self.by_link[key[2]] = key
+        if len(self.keys) > TOP_CAPACITY:
+            worst = self.keys.pop()
+            del self.by_link[worst[2]]
+            self.truncated = True
+
+    def update(self, link: str, avg_score: float, ratings_count: int):
+        old = self.by_link.pop(link, None)
+        if old is not None:
+            self.keys.pop(bisect.bisect_left(self.keys, old))
+
+        if ratings_count < TOP_MIN_RATINGS:
+            return
+        key = _key(link, avg_score, ratings_count)
+        # Если за пределами списка могут быть видео лучше этого, в список его не берём:
+        # инвариант сохраняется, а недостающие места заполнит перестройка из индекса
+        if not self.truncated or (self.keys and key < self.keys[-1]):
+            self._insert(key)
+
+    def top(self, k: int) -> List[Key]:
+        return self.keys[:k]
+
+
+class Leaderboard:
+    """Топ-K видео по категориям, обновляемый по месту при каждой оценке"""
+
+    def __init__(self, db_pool: asyncpg.Pool):
+        self.db_pool = db_pool
+        self._tops: Dict[str, _CategoryTop] = {}
+
+    async def load(self, category: str):
+        """Перестраивает топ категории по индексу videos_top_idx"""
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT link, avg_score, ratings_count FROM videos
+                WHERE category = $1 AND ratings_count >= $2
+                ORDER BY avg_score DESC, ratings_count DESC, link
+                LIMIT $3
+                """,
+                category, TOP_MIN_RATINGS, TOP_CAPACITY + 1
+            )
+        self._tops[category] = _CategoryTop(rows[:TOP_CAPACITY], truncated=len(rows) > TOP_CAPACITY)
+
+    def update(self, category: str, link: str, avg_score: float, ratings_count: int):
+        top = self._tops.get(category)
+        if top is not None:
+            top.update(link, avg_score, ratings_count)
+
+    def reset(self, category: str):
+        self._tops.pop(category, None)
+
+    def subscribe(self, cluster):
+        """Применяет оценки из других реплик. После resync топы перестроятся при первом запросе"""
+        cluster.on("rating", lambda event: self.update(
+            event["category"], event["link"], event["avg_score"], event["ratings_count"]
+        ))
+        cluster.on("cleared", lambda event: self.reset(event["category"]))
+        cluster.on("resync", lambda event: self._tops.clear())
+
+    async def top(self, category: str, k: int = TOP_DEFAULT_K) -> List[Tuple[str, float, int]]:
+        """Возвращает до k записей (ссылка, средняя оценка, число оценок)"""
+        k = min(k, TOP_CAPACITY)
+        top = self._tops.get(category)
+        if top is None or (top.truncated and len(top.keys) < k):
+            await self.load(category)
+            top = self._tops[category]
+        return [(link, -neg_avg, -neg_count) for neg_avg, neg_count, link in top.top(k)]
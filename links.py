@@ -0,0 +1,145 @@
+import re
+from typing import Iterable, List, Optional
+
+# Один проход по всему сообщению: ссылка тянется до пробела или кавычки, не захватывая
+# пунктуацию в конце, а части адреса сразу попадают в группы, так что разбирать её ещё раз не нужно
+_STOP = r'\s<>"\'«»'
+_TAIL = r'.,;:!?)\]}'
+URL_FINDER = re.compile(
+    rf'(?P<scheme>https?)://(?:[^{_STOP}/?#@]*@)?(?P<host>[\w-]+(?:\.[\w-]+)*)(?::(?P<port>\d{{1,5}}))?'
+    rf'(?P<path>/(?:[^{_STOP}?#]*[^{_STOP}?#{_TAIL}])?)?'
+    rf'(?:\?(?P<query>(?:[^{_STOP}#]*[^{_STOP}#{_TAIL}])?))?'
+    rf'(?:#(?:[^{_STOP}]*[^{_STOP}{_TAIL}])?)?'
+)
+
+HOST_REGEX = re.compile(r'^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})$')
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# Хосты-зеркала, которые приводим к одному виду
+HOST_PREFIXES = ("www.", "m.", "mobile.")
+
+# Трекинг рекламных систем убираем у любого сайта (плюс все utm_*)
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "yclid", "utm"})
+# Параметры шаринга видеоплатформ. У других сайтов ref, feature и т.п. могут значить
+# другое (например, ветку в ?ref=main), поэтому там их не трогаем
+PLATFORM_TRACKING_PARAMS = frozenset({
+    "si", "feature", "pp", "igshid", "igsh", "ref", "ref_src",
+    "_r", "_t", "is_from_webapp", "sender_device", "share_id", "share_app_id"
+})
+
+YOUTUBE_HOSTS = frozenset({"youtube.com", "youtu.be", "music.youtube.com", "youtube-nocookie.com"})
+YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+YOUTUBE_PATH_PREFIXES = ("/shorts/", "/embed/", "/live/", "/v/")
+
+PLATFORM_HOSTS = YOUTUBE_HOSTS | {"instagram.com", "tiktok.com", "vm.tiktok.com", "vt.tiktok.com"}
+
+INSTAGRAM_PATH = re.compile(r'^/(?:p|reel|reels|tv)/([A-Za-z0-9_-]+)')
+TIKTOK_VIDEO_PATH = re.compile(r'^/(@[^/]+)/video/(\d+)')
+
+
+def _is_tracking(param: str, platform: bool) -> bool:
+    param = param.lower()
+    return param in TRACKING_PARAMS or param.startswith("utm_") or (platform and param in PLATFORM_TRACKING_PARAMS)
+
+
+def _youtube(host: str, path: str, query: List[str]) -> Optional[str]:
+    video_id = None
+    if host == "youtu.be":
+        video_id = path.strip("/").split("/")[0]
+    elif path == "/watch":
+        video_id = next((pair[2:] for pair in query if pair.startswith("v=")), None)
+    else:
+        for prefix in YOUTUBE_PATH_PREFIXES:
+            if path.startswith(prefix):
+                video_id = path[len(prefix):].split("/")[0]
+                break
+    if video_id and YOUTUBE_ID.match(video_id):
+        return f"https://youtube.com/watch?v={video_id}"
+    return None
+
+
+def _canonical(scheme: str, host: str, port: Optional[str], path: str, query: str) -> Optional[str]:
+    host = host.lower()
+    if not HOST_REGEX.match(host):
+        return None
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+
+    if "//" in path:
+        path = re.sub(r'/{2,}', '/', path)
+    path = path.rstrip("/")
+    platform = host in PLATFORM_HOSTS
+    pairs = [
+        pair for pair in query.split("&") if pair and not _is_tracking(pair.partition("=")[0], platform)
+    ] if query else []
+
+    if host in YOUTUBE_HOSTS:
+        canonical = _youtube(host, path, pairs)
+        if canonical:
+            return canonical
+    elif host == "instagram.com":
+        match = INSTAGRAM_PATH.match(path)
+        if match:
+            return f"https://instagram.com/p/{match.group(1)}"
+    elif host == "tiktok.com":
+        match = TIKTOK_VIDEO_PATH.match(path)
+        if match:
+            return f"https://tiktok.com/{match.group(1)}/video/{match.group(2)}"
+    elif host in ("vm.tiktok.com", "vt.tiktok.com"):
+        # Короткую ссылку без сети не развернуть, но параметры у неё всегда лишние
+        return f"https://{host}{path}"
+
+    # На стандартном порту http и https считаем одним адресом, а на своём порту
+    # сайт может не отвечать по https, поэтому схему и порт оставляем как есть
+    if port is None or DEFAULT_PORTS[scheme] == port:
+        canonical = f"https://{host}{path}"
+    else:
+        canonical = f"{scheme}://{host}:{port}{path}"
+    if pairs:
+        canonical += "?" + "&".join(pairs)
+    return canonical
+
+
+def _keeps_paren(match: "re.Match") -> bool:
+    """Закрывающую скобку после ссылки оставляем, если она парная, как в /wiki/Foo_(bar)"""
+    path = match.group("path")
+    return bool(path and not match.group("query") and match.string[match.end():match.end() + 1] == ")"
+                and path.count("(") > path.count(")"))
+
+
+def _from_match(match: "re.Match") -> Optional[str]:
+    scheme, host, port, path, query = match.group("scheme", "host", "port", "path", "query")
+    path = path or ""
+    if _keeps_paren(match):
+        path += ")"
+    return _canonical(scheme, host, port, path, query or "")
+
+
+def canonicalize(url: str) -> Optional[str]:
+    """Приводит ссылку к каноническому виду или возвращает None, если это не ссылка.
+
+    Схема https (кроме http на нестандартном порту), без www./m., без трекинговых параметров,
+    фрагмента и слэша в конце.
+    Ссылки YouTube, Instagram и TikTok сводятся к одному виду для одного и того же видео.
+    """
+    url = url.strip()
+    match = URL_FINDER.match(url)
+    if not match:
+        return None
+    # После ссылки может остаться только её собственная закрывающая скобка
+    rest = url[match.end():]
+    if rest and not (rest == ")" and _keeps_paren(match)):
+        return None
+    return _from_match(match)
+
+
+def extract_links(text: str) -> List[str]:
+    """Все ссылки из текста в каноническом виде, без повторов, в порядке появления"""
+    return dedupe(_from_match(match) for match in URL_FINDER.finditer(text))
+
+
+def dedupe(links: Iterable[Optional[str]]) -> List[str]:
+    return list(dict.fromkeys(link for link in links if link))
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду на чат
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 30
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+
+# Сколько ждём перед отправкой, чтобы склеить подряд идущие сообщения в один чат
+MERGE_WINDOW = 0.05
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд нужно подождать перед отправкой"""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class _Outgoing:
+    method: str
+    kwargs: dict
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    mergeable: bool = True
+
+    def can_merge(self, kwargs: dict) -> bool:
+        # Склеиваем только простые текстовые сообщения, у предыдущего не должно быть клавиатуры
+        if not self.mergeable or self.method != "send_message" or self.kwargs.get("reply_markup") is not None:
+            return False
+        if self.kwargs.get("parse_mode") != kwargs.get("parse_mode"):
+            return False
+        merged_length = len(self.kwargs["text"]) + len(kwargs["text"]) + 2
+        return merged_length <= MAX_MESSAGE_LENGTH
+
+    def merge(self, kwargs: dict):
+        self.kwargs["text"] = f"{self.kwargs['text']}\n\n{kwargs['text']}"
+        self.kwargs["reply_markup"] = kwargs.get("reply_markup")
+
+
+class Outbox:
+    """Очередь исходящих сообщений с лимитами на чат и на бота.
+
+    Сообщения не отправляются сразу, а складываются в очередь чата. Подряд идущие
+    тексты в один чат склеиваются в одно сообщение (клавиатура берётся у последнего),
+    а при превышении лимитов или RetryAfter отправка откладывается, а не падает.
+    """
+
+    def __init__(self, bot, global_rate: float = GLOBAL_RATE, global_burst: int = GLOBAL_BURST,
+                 chat_rate: float = CHAT_RATE, chat_burst: int = CHAT_BURST):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._chat_buckets = {}
+        self._queues = {}
+        self._workers = {}
+
+    def _enqueue(self, chat_id: int, method: str, kwargs: dict, mergeable: bool = True) -> asyncio.Future:
+        queue = self._queues.setdefault(chat_id, deque())
+        if method == "send_message" and mergeable and queue and queue[-1].can_merge(kwargs):
+            queue[-1].merge(kwargs)
+            return queue[-1].future
+
+        item = _Outgoing(method, {"chat_id": chat_id, **kwargs}, mergeable=mergeable)
+        queue.append(item)
+        if chat_id not in self._workers:
+            if len(self._chat_buckets) > 10000:
+                self._prune_buckets()
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id))
+        return item.future
+
+    def _prune_buckets(self):
+        # Полностью восстановившийся bucket ничем не отличается от нового
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            bucket._refill()
+            if chat_id not in self._workers and bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+
+    async def send_message(self, chat_id: int, text: str, reply_markup=None, mergeable: bool = True,
+                           **kwargs) -> asyncio.Future:
+        """Ставит сообщение в очередь. Возвращает future, не дожидаясь отправки.
+
+        mergeable=False — для сообщений, которые потом редактируются: их ни с чем не склеиваем.
+        """
+        return self._enqueue(
+            chat_id, "send_message", {"text": text, "reply_markup": reply_markup, **kwargs}, mergeable=mergeable
+        )
+
+    async def send_document(self, chat_id: int, document, **kwargs) -> asyncio.Future:
+        return self._enqueue(chat_id, "send_document", {"document": document, **kwargs})
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Ставит правку в очередь. Ещё не отправленная правка того же сообщения заменяется новой"""
+        for item in self._queues.get(chat_id, ()):
+            if item.method == "edit_message_text" and item.kwargs["message_id"] == message_id:
+                item.kwargs.update(text=text, **kwargs)
+                return item.future
+        return self._enqueue(chat_id, "edit_message_text", {"message_id": message_id, "text": text, **kwargs})
+
+    async def _drain(self, chat_id: int):
+        queue = self._queues[chat_id]
+        bucket = self._chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+        try:
+            await asyncio.sleep(MERGE_WINDOW)
+            while queue:
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                item = queue.popleft()
+                try:
+                    result = await self._deliver(item)
+                except Exception as e:
+                    logger.error(f"Ошибка отправки в чат {chat_id}: {str(e)}")
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                        item.future.exception()  # помечаем как обработанное, если никто не ждёт
+                else:
+                    if not item.future.done():
+                        item.future.set_result(result)
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+
+    async def _deliver(self, item: _Outgoing):
+        method = getattr(self.bot, item.method)
+        while True:
+            try:
+                return await method(**item.kwargs)
+            except RetryAfter as e:
+                logger.warning(f"Flood limit, ждём {e.retry_after} с перед повтором")
+                await asyncio.sleep(float(e.retry_after))
+
+    async def close(self):
+        """Дожидается отправки всего, что осталось в очередях"""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+
+async def reply(update, context, text: str, reply_markup=None, **kwargs) -> Optional[asyncio.Future]:
+    """Отвечает в чат апдейта через Outbox, если он настроен, иначе напрямую"""
+    outbox = context.bot_data.get("outbox")
+    if outbox is None:
+        return await update.effective_message.reply_text(text, reply_markup=reply_markup, **kwargs)
+    return await outbox.send_message(update.effective_chat.id, text, reply_markup=reply_markup, **kwargs)
+
+
+async def reply_document(update, context, document, **kwargs) -> Optional[asyncio.Future]:
+    outbox = context.bot_data.get("outbox")
+    if outbox is None:
+        return await context.bot.send_document(chat_id=update.effective_chat.id, document=document, **kwargs)
+    return await outbox.send_document(update.effective_chat.id, document, **kwargs)
@@ -0,0 +1,135 @@
+"""Балансировщик вебхука Telegram для нескольких реплик бота.
+
+Запуск: python router.py
+Каждый апдейт уходит в реплику, выбранную по id пользователя (rendezvous hashing),
+поэтому user_data и состояния диалогов пользователя живут в одной реплике, а при
+появлении или падении реплики к другой переезжает только её доля пользователей.
+Реплики ищутся по DNS-имени сервиса docker-compose, оно резолвится во все контейнеры.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+from typing import List
+
+from aiohttp import ClientConnectorError, ClientSession, ClientTimeout, web
+from dotenv import load_dotenv
+
+load_dotenv()
+BOT_SERVICE = os.getenv("BOT_SERVICE", "bot")
+BOT_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+ROUTER_PORT = int(os.getenv("ROUTER_PORT", "8080"))
+
+# Как часто перечитываем список реплик из DNS, в секундах
+RESOLVE_INTERVAL = 5
+FORWARD_TIMEOUT = 30
+
+# Заголовки, которые нужны PTB в реплике, остальные не пересылаем
+FORWARD_HEADERS = ("content-type", "x-telegram-bot-api-secret-token")
+
+logger = logging.getLogger(__name__)
+
+
+def affinity_key(update: dict) -> str:
+    """Ключ привязки апдейта: id пользователя, иначе чата, иначе сам апдейт"""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        sender = value.get("from") or value.get("user")
+        if sender:
+            return f"user:{sender['id']}"
+        chat = value.get("chat")
+        if chat:
+            return f"chat:{chat['id']}"
+    return f"update:{update.get('update_id')}"
+
+
+def rank(key: str, replicas: List[str]) -> List[str]:
+    """Реплики в порядке предпочтения для ключа: первая — основная, остальные — запасные"""
+    return sorted(
+        replicas,
+        key=lambda replica: hashlib.blake2b(f"{key}|{replica}".encode(), digest_size=8).digest(),
+        reverse=True
+    )
+
+
+class Router:
+    def __init__(self, service: str, port: int):
+        self.service = service
+        self.port = port
+        self.replicas: List[str] = []
+        self.session = None
+
+    async def resolve(self):
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            self.service, self.port, family=socket.AF_INET, type=socket.SOCK_STREAM
+        )
+        replicas = sorted({info[4][0] for info in infos})
+        if replicas != self.replicas:
+            logger.info(f"Реплики {self.service}: {', '.join(replicas) or 'нет'}")
+        self.replicas = replicas
+
+    async def resolve_forever(self):
+        while True:
+            await asyncio.sleep(RESOLVE_INTERVAL)
+            try:
+                await self.resolve()
+            except OSError as e:
+                logger.warning(f"Не удалось получить список реплик: {str(e)}")
+
+    async def forward(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        key = affinity_key(update)
+        headers = {name: value for name, value in request.headers.items() if name.lower() in FORWARD_HEADERS}
+        for replica in rank(key, self.replicas):
+            try:
+                async with self.session.post(
+                    f"http://{replica}:{self.port}{request.path}", data=body, headers=headers
+                ) as response:
+                    return web.Response(status=response.status, body=await response.read())
+            except ClientConnectorError as e:
+                # Соединение не установлено, значит апдейт точно не доставлен и его можно отдать другой реплике
+                logger.warning(f"Реплика {replica} недоступна: {str(e)}")
+            except asyncio.TimeoutError:
+                # Реплика могла его уже принять, поэтому дальше не пересылаем, Telegram повторит сам
+                logger.warning(f"Реплика {replica} не ответила на апдейт {update.get('update_id')}")
+                break
+        return web.Response(status=503)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"replicas": self.replicas}, status=200 if self.replicas else 503)
+
+    async def lifecycle(self, app: web.Application):
+        self.session = ClientSession(timeout=ClientTimeout(total=FORWARD_TIMEOUT))
+        try:
+            await self.resolve()
+        except OSError as e:
+            logger.warning(f"Не удалось получить список реплик: {str(e)}")
+        task = asyncio.create_task(self.resolve_forever())
+        yield
+        task.cancel()
+        await self.session.close()
+
+
+def build_app(router: Router) -> web.Application:
+    app = web.Application()
+    app.cleanup_ctx.append(router.lifecycle)
+    app.router.add_get("/healthz", router.health)
+    app.router.add_post("/{path:.*}", router.forward)
+    return app
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    web.run_app(build_app(Router(BOT_SERVICE, BOT_PORT)), port=ROUTER_PORT)
+
+
+if __name__ == "__main__":
+    main()
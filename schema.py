@@ -0,0 +1,202 @@
+from typing import Optional
+
+import asyncpg
+
+# Категории, которые были зашиты в коде до появления реестра
+DEFAULT_CATEGORIES = ("qeep", "Harley", "Алтея")
+
+# Горячие таблицы секционированы по категории: у каждой категории свои секции
+# с локальными индексами, поэтому планирование и VACUUM не зависят от остальных
+PARTITIONED_TABLES = ("videos", "user_ratings")
+
+PARTITIONED_DDL = """
+    CREATE TABLE IF NOT EXISTS videos (
+        link TEXT NOT NULL,
+        category TEXT NOT NULL,
+        author_comment TEXT,
+        total_score INTEGER DEFAULT 0,
+        ratings_count INTEGER DEFAULT 0,
+        avg_score FLOAT DEFAULT 0,
+        comments TEXT[] DEFAULT '{}',
+        PRIMARY KEY (link, category)
+    ) PARTITION BY LIST (category);
+    CREATE TABLE IF NOT EXISTS videos_default PARTITION OF videos DEFAULT;
+    CREATE TABLE IF NOT EXISTS user_ratings (
+        user_id BIGINT NOT NULL,
+        video_link TEXT NOT NULL,
+        category TEXT NOT NULL,
+        PRIMARY KEY (user_id, video_link, category)
+    ) PARTITION BY LIST (category);
+    CREATE TABLE IF NOT EXISTS user_ratings_default PARTITION OF user_ratings DEFAULT;
+    -- В секции категория одна, поэтому индекс по оценке без category служит и топу категории,
+    -- и поиску по всем категориям сразу: Merge Append секций отдаёт строки уже в порядке оценки
+    DROP INDEX IF EXISTS videos_category_top_idx;
+    CREATE INDEX IF NOT EXISTS videos_top_idx
+        ON videos (avg_score DESC, ratings_count DESC, link);
+    CREATE INDEX IF NOT EXISTS videos_search_trgm_idx
+        ON videos USING gin (video_search_text(link, author_comment, comments) gin_trgm_ops);
+"""
+
+SCHEMA_DDL = """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    -- array_to_string и concat_ws не IMMUTABLE, а выражение индекса должно быть таким
+    CREATE OR REPLACE FUNCTION video_search_text(link TEXT, author_comment TEXT, comments TEXT[])
+    RETURNS TEXT LANGUAGE sql IMMUTABLE PARALLEL SAFE AS
+    $$ SELECT concat_ws(' ', link, author_comment, array_to_string(comments, ' ')) $$;
+    CREATE TABLE IF NOT EXISTS model_settings (
+        model_name TEXT PRIMARY KEY,
+        is_active BOOLEAN DEFAULT FALSE
+    );
+    CREATE TABLE IF NOT EXISTS categories (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        is_active BOOLEAN DEFAULT TRUE
+    );
+    ALTER TABLE categories ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+    CREATE TABLE IF NOT EXISTS exports (
+        category TEXT PRIMARY KEY,
+        content BYTEA NOT NULL,
+        rendered_at TIMESTAMPTZ NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS sessions (
+        id SERIAL PRIMARY KEY,
+        category TEXT NOT NULL,
+        archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        archived_by BIGINT NOT NULL,
+        videos_count INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS videos_archive (
+        session_id INTEGER NOT NULL REFERENCES sessions (id),
+        link TEXT NOT NULL,
+        author_comment TEXT,
+        total_score INTEGER,
+        ratings_count INTEGER,
+        avg_score FLOAT,
+        comments TEXT[],
+        PRIMARY KEY (session_id, link)
+    );
+    CREATE TABLE IF NOT EXISTS user_ratings_archive (
+        session_id INTEGER NOT NULL REFERENCES sessions (id),
+        user_id BIGINT NOT NULL,
+        video_link TEXT NOT NULL,
+        PRIMARY KEY (session_id, user_id, video_link)
+    );
+    CREATE TABLE IF NOT EXISTS job_runs (
+        name TEXT PRIMARY KEY,
+        last_started_at TIMESTAMPTZ NOT NULL,
+        duration_ms INTEGER NOT NULL
+    );
+    -- Задачи rollup_scores больше нет, её запись не должна висеть в /jobs
+    DELETE FROM job_runs WHERE name = 'rollup_scores';
+    CREATE TABLE IF NOT EXISTS admins (
+        user_id BIGINT PRIMARY KEY,
+        granted_by BIGINT,
+        granted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS ai_batches (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        chat_id BIGINT NOT NULL,
+        mode TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        leased_until TIMESTAMPTZ,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        finished_at TIMESTAMPTZ
+    );
+    CREATE TABLE IF NOT EXISTS ai_batch_items (
+        batch_id INTEGER NOT NULL REFERENCES ai_batches (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        input TEXT NOT NULL,
+        output TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (batch_id, position)
+    );
+"""
+
+# Колонки для переноса данных из старых несекционированных таблиц
+LEGACY_COLUMNS = {
+    "videos": "link, category, author_comment, total_score, ratings_count, avg_score, comments",
+    "user_ratings": "user_id, video_link, category"
+}
+
+
+async def partition_name(conn: asyncpg.Connection, table: str, category: str) -> Optional[str]:
+    """Имя секции категории или None, если категория не зарегистрирована"""
+    category_id = await conn.fetchval("SELECT id FROM categories WHERE name = $1", category)
+    return None if category_id is None else f"{table}_c{category_id}"
+
+
+async def ensure_partitions(conn: asyncpg.Connection, category: str):
+    """Создаёт секции категории, если их ещё нет. Вызывать внутри транзакции"""
+    for table in PARTITIONED_TABLES:
+        name = await partition_name(conn, table, category)
+        if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", name):
+            continue
+
+        default = f"{table}_default"
+        # Строки категории могли попасть в DEFAULT-секцию: тогда создать секцию не получится,
+        # пока они там, поэтому временно отсоединяем DEFAULT и переносим их
+        leftovers = await conn.fetchval(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE category = $1)", category)
+        if leftovers:
+            await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+
+        # DDL не принимает параметры, поэтому экранируем имя и значение на стороне сервера
+        ddl = await conn.fetchval(
+            "SELECT format('CREATE TABLE %I PARTITION OF %I FOR VALUES IN (%L)', $1::text, $2::text, $3::text)",
+            name, table, category
+        )
+        await conn.execute(ddl)
+
+        if leftovers:
+            await conn.execute(f"INSERT INTO {table} SELECT * FROM {default} WHERE category = $1", category)
+            await conn.execute(f"DELETE FROM {default} WHERE category = $1", category)
+            await conn.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+
+
+async def _migrate_legacy(conn: asyncpg.Connection):
+    """Переименовывает обычные таблицы, оставшиеся от версии без секционирования"""
+    migrated = []
+    for table in PARTITIONED_TABLES:
+        relkind = await conn.fetchval(
+            "SELECT relkind::text FROM pg_class WHERE oid = to_regclass($1)", table
+        )
+        if relkind == "r":
+            await conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+            await conn.execute(f"ALTER TABLE {table}_legacy RENAME CONSTRAINT {table}_pkey TO {table}_legacy_pkey")
+            migrated.append(table)
+    return migrated
+
+
+async def init_schema(conn: asyncpg.Connection):
+    async with conn.transaction():
+        # Миграцию схемы выполняет одна реплика за раз
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('init_schema'))")
+        await conn.execute(SCHEMA_DDL)
+        await conn.executemany(
+            "INSERT INTO categories (name) VALUES ($1) ON CONFLICT (name) DO NOTHING",
+            [(name,) for name in DEFAULT_CATEGORIES]
+        )
+
+        migrated = await _migrate_legacy(conn)
+        await conn.execute(PARTITIONED_DDL)
+
+        # Категории из старых данных регистрируем неактивными, чтобы им тоже досталась секция
+        for table in migrated:
+            await conn.execute(
+                f"""
+                INSERT INTO categories (name, is_active)
+                SELECT DISTINCT category, FALSE FROM {table}_legacy
+                ON CONFLICT (name) DO NOTHING
+                """
+            )
+
+        for row in await conn.fetch("SELECT name FROM categories"):
+            await ensure_partitions(conn, row["name"])
+
+        for table in migrated:
+            columns = LEGACY_COLUMNS[table]
+            await conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_legacy")
+            await conn.execute(f"DROP TABLE {table}_legacy")
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import asyncpg
+
+# Короче трёх символов триграммный индекс не работает, а совпадений слишком много
+SEARCH_MIN_LENGTH = 3
+# Telegram показывает до 50 результатов за раз, но листать столько неудобно
+SEARCH_PAGE_SIZE = 20
+# Сколько лучших по оценке совпадений можно пролистать по одному запросу
+SEARCH_MAX_RESULTS = 200
+SEARCH_CACHE_TTL = 30
+SEARCH_CACHE_SIZE = 1000
+# Длина фрагмента комментария в выдаче
+SNIPPET_LENGTH = 200
+
+# Совпадения упорядочены по средней оценке, как в /top, среди всех видео активных категорий.
+# План выбирает Postgres по статистике выражения индекса videos_search_trgm_idx (выражение
+# в WHERE совпадает с ним): редкий текст находится по этому индексу, и сортируются только
+# найденные строки; частый текст дешевле искать, проходя секции по videos_top_idx уже в
+# порядке оценки до первых SEARCH_MAX_RESULTS совпадений. Фрагмент считается только для
+# попавших в выдачу строк
+SEARCH_SQL = f"""
+    WITH found AS (
+        SELECT link, category, author_comment, avg_score, ratings_count, comments
+        FROM videos
+        WHERE video_search_text(link, author_comment, comments) ILIKE $1
+          AND category IN (SELECT name FROM categories WHERE is_active)
+        ORDER BY avg_score DESC, ratings_count DESC, link
+        LIMIT {SEARCH_MAX_RESULTS}
+    )
+    SELECT link, category, avg_score, ratings_count,
+           left(coalesce(
+               CASE WHEN author_comment ILIKE $1 THEN author_comment END,
+               (SELECT c FROM unnest(comments) AS c WHERE c ILIKE $1 LIMIT 1),
+               author_comment
+           ), {SNIPPET_LENGTH}) AS snippet
+    FROM found
+    ORDER BY avg_score DESC, ratings_count DESC, link
+"""
+
+
+def normalize(query: str) -> str:
+    return " ".join(query.split()).lower()
+
+
+def _like_pattern(query: str) -> str:
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class VideoSearch:
+    """Поиск по ссылкам, комментариям авторов и оценщиков для inline-режима.
+
+    Выдача — лучшие по оценке SEARCH_MAX_RESULTS совпадений из активных категорий. Она
+    кэшируется на SEARCH_CACHE_TTL секунд, поэтому следующие страницы и повторы того же
+    текста в базу не ходят.
+    """
+
+    def __init__(self, db_pool: asyncpg.Pool):
+        self.db_pool = db_pool
+        self._cache: "OrderedDict[str, Tuple[float, List[asyncpg.Record]]]" = OrderedDict()
+
+    async def search(self, query: str, offset: int = 0) -> Tuple[List[asyncpg.Record], Optional[int]]:
+        """Страница результатов и offset следующей страницы (None, если это последняя)"""
+        query = normalize(query)
+        if len(query) < SEARCH_MIN_LENGTH:
+            return [], None
+        rows = await self._rows(query)
+        end = offset + SEARCH_PAGE_SIZE
+        return rows[offset:end], end if end < len(rows) else None
+
+    async def _rows(self, query: str) -> List[asyncpg.Record]:
+        cached = self._cache.get(query)
+        if cached is not None and cached[0] > time.monotonic():
+            self._cache.move_to_end(query)
+            return cached[1]
+
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(SEARCH_SQL, _like_pattern(query))
+        self._cache[query] = (time.monotonic() + SEARCH_CACHE_TTL, rows)
+        self._cache.move_to_end(query)
+        if len(self._cache) > SEARCH_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return rows
+
+    def expire(self):
+        """Убирает просроченные запросы из кэша"""
+        now = time.monotonic()
+        for query in [query for query, (expires_at, _) in self._cache.items() if expires_at <= now]:
+            del self._cache[query]
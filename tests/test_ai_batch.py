@@ -0,0 +1,160 @@
+import asyncio
+import io
+import zipfile
+
+import pytest
+
+import ai_batch
+from ai_batch import AI_BATCH_MAX_ITEMS, AI_BATCH_RETRIES, BatchFileError, PermanentError, parse_batch_file
+
+SCRIPT = "Scene 1: герой входит\nScene 2: герой говорит\nScene 3: герой уходит"
+
+
+def texts(items):
+    return [text for _, text in items]
+
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["script_review", "new_script"])
+def test_txt_split_by_dashes(mode):
+    data = "первый\nсценарий\n---\n\nвторой\n\nс абзацем\n ----- \nтретий".encode()
+    assert texts(parse_batch_file("a.txt", data, mode)) == ["первый\nсценарий", "второй\n\nс абзацем", "третий"]
+
+
+@pytest.mark.parametrize("mode", ["script_review", "new_script"])
+def test_txt_split_by_blank_lines(mode):
+    data = "первый\nсценарий\r\n\r\nвторой\n  \nтретий\n".encode()
+    assert texts(parse_batch_file("a.txt", data, mode)) == ["первый\nсценарий", "второй", "третий"]
+
+
+def test_txt_without_separators_is_one_script():
+    items = parse_batch_file("a.txt", SCRIPT.encode(), "script_review")
+    assert texts(items) == [SCRIPT]
+    assert items[0][0] == "Scene 1: герой входит"
+
+
+def test_txt_without_separators_is_topics_per_line():
+    assert ai_batch.LINE_ITEM_MODES == {"new_script"}
+    assert texts(parse_batch_file("a.txt", SCRIPT.encode(), "new_script")) == SCRIPT.split("\n")
+
+
+def test_txt_cp1251_and_long_title():
+    title = "т" * 100
+    items = parse_batch_file("a.txt", f"{title}\nтекст".encode("cp1251"), "script_review")
+    assert items[0][1] == f"{title}\nтекст"
+    assert len(items[0][0]) == ai_batch.TITLE_LENGTH and items[0][0].endswith("…")
+
+
+@pytest.mark.parametrize("data, expected", [
+    # Колонка по заголовку, сам заголовок не элемент
+    ("id,тема\n1,про котов\n2,про собак\n", ["про котов", "про собак"]),
+    ("Script;author\nпервый;a\nвторой;b\n", ["первый", "второй"]),
+    # Без известного заголовка — первая колонка, первая строка тоже элемент
+    ("первый,x\nвторой,y\n", ["первый", "второй"]),
+    # Пустые строки и ячейки пропускаются, многострочная ячейка остаётся одним элементом
+    ('text,n\n"строка 1\nстрока 2",1\n,2\n\nтретий,3\n', ["строка 1\nстрока 2", "третий"]),
+])
+def test_csv_column_selection(data, expected):
+    assert texts(parse_batch_file("a.csv", data.encode(), "script_review")) == expected
+
+
+def test_zip_items_are_files_in_name_order():
+    data = make_zip({
+        "b.txt": "второй",
+        "dir/a.md": "первый",
+        "__MACOSX/._a.md": "мусор",
+        ".hidden.txt": "скрытый",
+        "image.png": "не текст",
+        "empty.txt": "  ",
+    })
+    assert parse_batch_file("a.zip", data, "script_review") == [("b", "второй"), ("a", "первый")]
+
+
+def test_zip_unpacked_size_limit(monkeypatch):
+    monkeypatch.setattr(ai_batch, "AI_BATCH_MAX_UNPACKED_BYTES", 1000)
+    # Сжимается в разы, поэтому лимит проверяется по распакованному размеру
+    data = make_zip({"a.txt": "а" * 400, "b.txt": "б" * 400})
+    assert len(data) < 1000
+    with pytest.raises(BatchFileError, match="после распаковки"):
+        parse_batch_file("a.zip", data, "script_review")
+
+
+@pytest.mark.parametrize("filename, data, message", [
+    ("a.pdf", b"x", "Поддерживаются"),
+    ("a.txt", b"  \n\n ", "ни одного"),
+    ("a.zip", b"not a zip", "архив"),
+    ("a.txt", "\n".join(["тема"] * (AI_BATCH_MAX_ITEMS + 1)).encode(), "Слишком много"),
+    ("a.txt", ("x" * (ai_batch.AI_BATCH_MAX_ITEM_CHARS + 1)).encode(), "длиннее"),
+])
+def test_bad_files(filename, data, message):
+    with pytest.raises(BatchFileError, match=message):
+        parse_batch_file(filename, data, "new_script")
+
+
+class FakeCall:
+    """Падает заданными ошибками, затем отвечает"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self, text):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"ответ: {text}"
+
+
+def run_item(call):
+    return asyncio.run(ai_batch._run_item(call, asyncio.Semaphore(1), "вход"))
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ai_batch, "AI_BATCH_BACKOFF", 0)
+
+
+def test_run_item_success():
+    assert run_item(FakeCall()) == ("ответ: вход", None, 1)
+
+
+def test_run_item_retries_then_succeeds():
+    call = FakeCall(RuntimeError("timeout"), ConnectionError("reset"))
+    assert run_item(call) == ("ответ: вход", None, 3)
+    assert call.calls == 3
+
+
+def test_run_item_gives_up_after_retries():
+    call = FakeCall(*[RuntimeError(f"ошибка {n}") for n in range(AI_BATCH_RETRIES + 1)])
+    assert run_item(call) == (None, f"ошибка {AI_BATCH_RETRIES - 1}", AI_BATCH_RETRIES)
+    assert call.calls == AI_BATCH_RETRIES
+
+
+def test_run_item_permanent_error_stops_early():
+    call = FakeCall(RuntimeError("timeout"), PermanentError("API ответил 400"))
+    assert run_item(call) == (None, "API ответил 400", 2)
+    assert call.calls == 2
+
+
+def test_run_item_holds_semaphore_only_during_calls():
+    semaphore = asyncio.Semaphore(1)
+    seen = []
+
+    async def call(text):
+        seen.append(semaphore.locked())
+        if len(seen) == 1:
+            raise RuntimeError("timeout")
+        return "ok"
+
+    async def main():
+        return await ai_batch._run_item(call, semaphore, "вход"), semaphore.locked()
+
+    assert asyncio.run(main()) == (("ok", None, 2), False)
+    assert seen == [True, True]
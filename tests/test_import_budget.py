@@ -0,0 +1,10 @@
+from benchmarks.import_benchmark import DEFAULT_BUDGET_MS, MODULE, loaded_lazy_modules, measure
+
+# Медиана по нескольким холодным импортам, чтобы один медленный запуск не ронял тест
+RUNS = 3
+
+
+def test_import_budget():
+    total_ms, timings = measure(RUNS)
+    assert loaded_lazy_modules(timings) == []
+    assert total_ms <= DEFAULT_BUDGET_MS, f"import {MODULE} занял {total_ms:.1f} мс"
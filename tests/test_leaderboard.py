@@ -0,0 +1,63 @@
+from leaderboard import TOP_CAPACITY, TOP_MIN_RATINGS, _CategoryTop
+
+ENOUGH = TOP_MIN_RATINGS
+
+
+def make_top(scores, truncated=False):
+    rows = [{"link": link, "avg_score": score, "ratings_count": count} for link, score, count in scores]
+    return _CategoryTop(rows, truncated=truncated)
+
+
+def links(top):
+    return [link for _, _, link in top.keys]
+
+
+def test_score_change_reorders_members():
+    top = make_top([("a", 9, ENOUGH), ("b", 8, ENOUGH), ("c", 7, ENOUGH)])
+    top.update("c", 9.5, ENOUGH + 1)
+    assert links(top) == ["c", "a", "b"]
+    assert set(top.by_link) == {"a", "b", "c"}
+
+
+def test_member_dropping_below_tail_leaves_truncated_list():
+    # За пределами списка могут быть видео лучше нового счёта b, поэтому b выпадает
+    top = make_top([("a", 9, ENOUGH), ("b", 8, ENOUGH), ("c", 7, ENOUGH)], truncated=True)
+    top.update("b", 5, ENOUGH + 1)
+    assert links(top) == ["a", "c"]
+    assert "b" not in top.by_link
+    assert top.truncated
+
+
+def test_member_dropping_below_tail_stays_when_list_is_complete():
+    top = make_top([("a", 9, ENOUGH), ("b", 8, ENOUGH), ("c", 7, ENOUGH)])
+    top.update("b", 5, ENOUGH + 1)
+    assert links(top) == ["a", "c", "b"]
+
+
+def test_new_key_past_capacity_drops_worst():
+    top = make_top([(f"v{i:03}", 5, ENOUGH) for i in range(TOP_CAPACITY)])
+    top.update("best", 10, ENOUGH)
+    assert len(top.keys) == TOP_CAPACITY
+    assert links(top)[0] == "best"
+    assert f"v{TOP_CAPACITY - 1:03}" not in top.by_link
+    assert top.truncated
+
+    # Теперь видео хуже хвоста в список не попадает
+    top.update("worse", 1, ENOUGH)
+    assert "worse" not in top.by_link
+    assert len(top.keys) == TOP_CAPACITY
+
+
+def test_ties_are_broken_by_ratings_count_then_link():
+    top = make_top([])
+    top.update("b", 8, ENOUGH)
+    top.update("a", 8, ENOUGH)
+    top.update("c", 8, ENOUGH + 5)
+    assert links(top) == ["c", "a", "b"]
+
+
+def test_too_few_ratings_removes_entry():
+    top = make_top([("a", 9, ENOUGH)])
+    top.update("a", 9, ENOUGH - 1)
+    top.update("b", 10, ENOUGH - 1)
+    assert top.keys == [] and top.by_link == {}
@@ -0,0 +1,68 @@
+import pytest
+
+from links import canonicalize, extract_links
+
+VIDEO = "https://youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+@pytest.mark.parametrize("url, expected", [
+    # YouTube: все варианты одного видео сводятся к одной ссылке
+    ("https://youtu.be/dQw4w9WgXcQ?si=abc", VIDEO),
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQ&feature=share", VIDEO),
+    ("https://m.youtube.com/shorts/dQw4w9WgXcQ", VIDEO),
+    ("https://youtube.com/embed/dQw4w9WgXcQ", VIDEO),
+    ("http://youtube.com/live/dQw4w9WgXcQ/", VIDEO),
+    ("https://youtube.com/channel/abc", "https://youtube.com/channel/abc"),
+    # Instagram и TikTok
+    ("https://www.instagram.com/reel/Cx1abc_-2/?igsh=zz", "https://instagram.com/p/Cx1abc_-2"),
+    ("https://instagram.com/p/Cx1abc_-2/", "https://instagram.com/p/Cx1abc_-2"),
+    ("https://www.tiktok.com/@user.name/video/7234567890123456789?is_from_webapp=1&sender_device=pc",
+     "https://tiktok.com/@user.name/video/7234567890123456789"),
+    ("https://vm.tiktok.com/ZM6abc/?x=1", "https://vm.tiktok.com/ZM6abc"),
+    # Остальные сайты: регистр хоста, двойные слэши, трекинг и фрагмент
+    ("http://Example.COM//a//b/?utm_source=x&q=1#frag", "https://example.com/a/b?q=1"),
+    ("https://example.com/a?fbclid=1&gclid=2", "https://example.com/a"),
+    # Параметры шаринга платформ убираем только у самих платформ
+    ("https://github.com/a/b?ref=main", "https://github.com/a/b?ref=main"),
+    ("https://example.com/a?feature=x&si=1&utm_source=y", "https://example.com/a?feature=x&si=1"),
+    ("https://youtube.com/channel/abc?si=1&feature=share", "https://youtube.com/channel/abc"),
+    ("https://en.wikipedia.org/wiki/Foo_(bar)", "https://en.wikipedia.org/wiki/Foo_(bar)"),
+    # Схема и порт
+    ("http://example.com:80/a", "https://example.com/a"),
+    ("https://example.com:443/a", "https://example.com/a"),
+    ("http://example.com:8080/a", "http://example.com:8080/a"),
+    ("https://example.com:8443/a/", "https://example.com:8443/a"),
+    # Не ссылки
+    ("not a link", None),
+    ("https://localhost/a", None),
+    ("https://example.com/a.", None),
+    ("https://example.com/a)", None),
+    ("https://example.com/a b", None),
+])
+def test_canonicalize(url, expected):
+    assert canonicalize(url) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", []),
+    ("без ссылок", []),
+    ("Смотри https://youtu.be/dQw4w9WgXcQ, и https://www.youtube.com/watch?v=dQw4w9WgXcQ.", [VIDEO]),
+    ("(https://example.com/a) «https://example.com/b»!", ["https://example.com/a", "https://example.com/b"]),
+    ("см. https://en.wikipedia.org/wiki/Foo_(bar).", ["https://en.wikipedia.org/wiki/Foo_(bar)"]),
+    ("https://example.com/b\nhttps://example.com/a\nhttps://example.com/b/",
+     ["https://example.com/b", "https://example.com/a"]),
+    ("https://example.com:8080/x?", ["https://example.com:8080/x"]),
+])
+def test_extract_links(text, expected):
+    assert extract_links(text) == expected
+
+
+@pytest.mark.parametrize("url", [
+    "https://youtu.be/dQw4w9WgXcQ?si=abc",
+    "https://www.instagram.com/reel/Cx1abc_-2/?igsh=zz",
+    "http://example.com:8080/a",
+    "http://Example.COM//a//b/?utm_source=x&q=1#frag",
+])
+def test_canonicalize_is_idempotent(url):
+    canonical = canonicalize(url)
+    assert canonicalize(canonical) == canonical